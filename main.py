@@ -3,11 +3,21 @@ from src.users.routes import auth_router
 from src.middleware import register_middleware
 from src.errors import register_all_errors
 import uvicorn, os
-from src.db.main import create_tables
+from src.db.main import create_tables, engine, pool_stats, replica_router
+from src.db.partitions import ensure_future_partitions
 from contextlib import asynccontextmanager
 import logging
 from src.chat.routes import chat_router
 from src.chat.upload.routes import folder_router
+from src.chat.routes import chat_client
+from src.chat.archive import message_archive
+from src.chat.transport import upstream
+from src.users.auth import password_hasher, revoked_tokens, revoked_users, token_cache
+from src.users.email import email_outbox
+from src.users.tokens import purge_expired_tokens
+from src.users.service import user_cache
+from src.background import PeriodicTask
+from src.config import settings
 
 
 from src.logging_config import setup_logging
@@ -29,13 +39,45 @@ To enhance performance, the app will incorporate caching mechanisms to optimize
 
 version_prefix = f"/api/{version}"
 
+# Finishes deletions that were too large to run inside the request
+chat_purge = PeriodicTask("chat-purge", settings.CHAT_PURGE_INTERVAL, chat_client.purge_deleted_sessions)
+# Sends verification and password reset emails queued by the auth endpoints
+email_delivery = PeriodicTask("email-outbox", settings.EMAIL_OUTBOX_INTERVAL, email_outbox.deliver_pending)
+# Deletes sent and dead emails once they are past EMAIL_OUTBOX_RETENTION
+email_purge = PeriodicTask("email-outbox-purge", settings.EMAIL_OUTBOX_PURGE_INTERVAL, email_outbox.purge_finished)
+# Deletes expired verification and password reset tokens
+auth_token_purge = PeriodicTask("auth-token-purge", settings.AUTH_TOKEN_PURGE_INTERVAL, purge_expired_tokens)
+# Keeps monthly chat_messages partitions created ahead of time
+chat_partitions = PeriodicTask(
+    "chat-partitions", settings.CHAT_PARTITION_CHECK_INTERVAL, lambda: ensure_future_partitions(engine)
+)
+# Moves old partitions to the cold archive (off unless CHAT_ARCHIVE_ENABLED)
+chat_archive = PeriodicTask("chat-archive", settings.CHAT_ARCHIVE_INTERVAL, message_archive.archive_old_partitions)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Application starting...")
     await create_tables()
+    await ensure_future_partitions(engine)
+    await upstream.start()
+    chat_purge.start()
+    email_delivery.start()
+    email_purge.start()
+    auth_token_purge.start()
+    chat_partitions.start()
+    if settings.CHAT_ARCHIVE_ENABLED:
+        chat_archive.start()
     yield
     print("Application shutting down...")
+    await chat_archive.stop()
+    await chat_partitions.stop()
+    await auth_token_purge.stop()
+    await email_purge.stop()
+    await email_delivery.stop()
+    await chat_purge.stop()
+    await upstream.close()
+    password_hasher.shutdown()
 
 
 app = FastAPI(
@@ -66,6 +108,38 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+
+@app.get("/health/upstream")
+async def upstream_health():
+    return chat_client.stats()
+
+
+@app.get("/health/db")
+async def db_health():
+    return {"pools": pool_stats(), "replica": replica_router.stats()}
+
+
+@app.get("/health/auth")
+async def auth_health():
+    return {
+        "password_hasher": password_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "revocations": {"tokens": revoked_tokens.stats(), "users": revoked_users.stats()},
+        "user_cache": user_cache.stats(),
+    }
+
+
+@app.get("/health/jobs")
+async def jobs_health():
+    return {
+        "chat_purge": chat_purge.stats(),
+        "email_outbox": {**email_delivery.stats(), **email_outbox.stats()},
+        "email_outbox_purge": email_purge.stats(),
+        "auth_token_purge": auth_token_purge.stats(),
+        "chat_partitions": chat_partitions.stats(),
+        "chat_archive": {**chat_archive.stats(), **message_archive.stats()},
+    }
+
 # Register error handlers and middleware
 register_all_errors(app)
 register_middleware(app)
@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -16,6 +17,12 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Same database as the app, through the sync driver
+if os.getenv("DATABASE_URL"):
+    config.set_main_option(
+        "sqlalchemy.url", os.environ["DATABASE_URL"].replace("+asyncpg", "").replace("%", "%%")
+    )
+
 
 target_metadata = sqlmodel.SQLModel.metadata
 
@@ -0,0 +1,51 @@
+"""Soft-delete chat sessions and detach them from deleted users
+
+Revision ID: 4c2a9e61d0b7
+Revises: b7e3c1d92f4a
+Create Date: 2026-10-17 11:40:05.227914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2a9e61d0b7'
+down_revision: Union[str, None] = 'b7e3c1d92f4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable column without a default: a catalog-only change
+    op.add_column('chat_sessions', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # Re-point the user FK to ON DELETE SET NULL. NOT VALID skips the full-table
+    # check while the ALTER holds its lock; VALIDATE runs in its own transaction
+    # under a lock that does not block writes.
+    op.drop_constraint('chat_sessions_user_id_fkey', 'chat_sessions', type_='foreignkey')
+    op.execute(
+        "ALTER TABLE chat_sessions ADD CONSTRAINT chat_sessions_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE SET NULL NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE chat_sessions VALIDATE CONSTRAINT chat_sessions_user_id_fkey")
+        # Lets the purge job find pending work without scanning live sessions
+        op.create_index(
+            'ix_chat_sessions_deleted_at', 'chat_sessions', ['deleted_at'],
+            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chat_sessions_deleted_at', table_name='chat_sessions', postgresql_concurrently=True, if_exists=True)
+    op.drop_constraint('chat_sessions_user_id_fkey', 'chat_sessions', type_='foreignkey')
+    op.create_foreign_key('chat_sessions_user_id_fkey', 'chat_sessions', 'users', ['user_id'], ['id'])
+    op.drop_column('chat_sessions', 'deleted_at')
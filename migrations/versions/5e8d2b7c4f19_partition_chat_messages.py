@@ -0,0 +1,125 @@
+"""Partition chat_messages by month on created_at and add chat_message_archives
+
+Revision ID: 5e8d2b7c4f19
+Revises: 9f1d6b3e8a25
+Create Date: 2026-10-17 16:21:07.118204
+
+The existing table is copied into the partitioned one, so run this in a
+maintenance window: writes to chat_messages block until it commits.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8d2b7c4f19'
+down_revision: Union[str, None] = '9f1d6b3e8a25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("LOCK TABLE chat_messages IN SHARE MODE")
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned")
+    op.execute("ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey")
+    op.execute("ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_session_id_fkey TO chat_messages_unpartitioned_session_id_fkey")
+    op.execute("ALTER INDEX ix_chat_messages_session_id_created_at RENAME TO ix_chat_messages_unpartitioned_session_id_created_at")
+
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id uuid NOT NULL,
+            session_id uuid NOT NULL REFERENCES chat_sessions (id) ON DELETE CASCADE,
+            sender varchar NOT NULL,
+            content varchar NOT NULL,
+            created_at timestamp without time zone NOT NULL,
+            CONSTRAINT chat_messages_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT")
+
+    # One partition per month from the oldest message to MONTHS_AHEAD months
+    # out; later months are created by src.db.partitions at runtime
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE((
+                        SELECT min(COALESCE(m.created_at, s.created_at))
+                        FROM chat_messages_unpartitioned m LEFT JOIN chat_sessions s ON s.id = m.session_id
+                    ), now())),
+                    date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE chat_messages_p%s PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+                    to_char(month, 'YYYYMM'), month, month + interval '1 month'
+                );
+            END LOOP;
+        END $$
+    """)
+
+    # Rows written before created_at was required take their session's time
+    op.execute("""
+        INSERT INTO chat_messages (id, session_id, sender, content, created_at)
+        SELECT m.id, m.session_id, m.sender, m.content, COALESCE(m.created_at, s.created_at, now())
+        FROM chat_messages_unpartitioned m
+        LEFT JOIN chat_sessions s ON s.id = m.session_id
+    """)
+    op.create_index('ix_chat_messages_session_id_created_at', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+    op.drop_table('chat_messages_unpartitioned')
+
+    op.create_table('chat_message_archives',
+    sa.Column('session_id', sa.UUID(), nullable=False),
+    sa.Column('partition_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('path', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('offset', sa.Integer(), nullable=True),
+    sa.Column('length', sa.Integer(), nullable=True),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.Column('restored_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('session_id', 'partition_name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Messages already moved to the cold archive are not brought back; restore
+    them first if they are needed.
+    """
+    op.drop_table('chat_message_archives')
+
+    op.execute("LOCK TABLE chat_messages IN SHARE MODE")
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_partitioned")
+    op.execute("ALTER TABLE chat_messages_partitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_partitioned_pkey")
+    op.execute("ALTER INDEX ix_chat_messages_session_id_created_at RENAME TO ix_chat_messages_partitioned_session_id_created_at")
+
+    op.create_table('chat_messages',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('session_id', sa.UUID(), nullable=False),
+    sa.Column('sender', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('content', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("""
+        INSERT INTO chat_messages (id, session_id, sender, content, created_at)
+        SELECT id, session_id, sender, content, created_at FROM chat_messages_partitioned
+    """)
+    op.create_index('ix_chat_messages_session_id_created_at', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+    # Dropping the parent drops every attached partition with it. The foreign
+    # key is added afterwards because its name is still taken by the partitions.
+    op.drop_table('chat_messages_partitioned')
+    op.create_foreign_key('chat_messages_session_id_fkey', 'chat_messages', 'chat_sessions', ['session_id'], ['id'], ondelete='CASCADE')
@@ -0,0 +1,64 @@
+"""Add message_count, last_message_at and last_message_preview to chat_sessions
+
+Revision ID: 9f1d6b3e8a25
+Revises: 4c2a9e61d0b7
+Create Date: 2026-10-17 14:02:48.660531
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f1d6b3e8a25'
+down_revision: Union[str, None] = '4c2a9e61d0b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PREVIEW_LENGTH = 200
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_sessions', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('last_message_preview', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+    # Backfill from the messages; each subquery is a range scan on
+    # ix_chat_messages_session_id_created_at. Sessions without messages fall
+    # back to their creation time so last_message_at is never NULL.
+    op.execute(f"""
+        UPDATE chat_sessions s SET
+            message_count = (SELECT count(*) FROM chat_messages m WHERE m.session_id = s.id),
+            last_message_at = COALESCE(
+                (SELECT max(m.created_at) FROM chat_messages m WHERE m.session_id = s.id),
+                s.created_at
+            ),
+            last_message_preview = (
+                SELECT left(m.content, {PREVIEW_LENGTH}) FROM chat_messages m
+                WHERE m.session_id = s.id
+                ORDER BY m.created_at DESC, m.id DESC
+                LIMIT 1
+            )
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_chat_sessions_user_id_last_message_at', 'chat_sessions',
+            ['user_id', 'last_message_at'],
+            postgresql_where=sa.text('deleted_at IS NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chat_sessions_user_id_last_message_at', table_name='chat_sessions', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('chat_sessions', 'last_message_preview')
+    op.drop_column('chat_sessions', 'last_message_at')
+    op.drop_column('chat_sessions', 'message_count')
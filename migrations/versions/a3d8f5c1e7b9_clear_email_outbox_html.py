@@ -0,0 +1,35 @@
+"""Let email_outbox.html be cleared once an email is sent or dead
+
+Revision ID: a3d8f5c1e7b9
+Revises: c7a4e9f2d1b3
+Create Date: 2026-10-17 21:48:55.207614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d8f5c1e7b9'
+down_revision: Union[str, None] = 'c7a4e9f2d1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('email_outbox', 'html', existing_type=sqlmodel.sql.sqltypes.AutoString(), nullable=True)
+    # The bodies hold raw verification and reset tokens
+    op.execute("UPDATE email_outbox SET html = NULL WHERE status IN ('sent', 'dead')")
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Cleared bodies are not recoverable; they come back empty.
+    """
+    op.execute("UPDATE email_outbox SET html = '' WHERE html IS NULL")
+    op.alter_column('email_outbox', 'html', existing_type=sqlmodel.sql.sqltypes.AutoString(), nullable=False)
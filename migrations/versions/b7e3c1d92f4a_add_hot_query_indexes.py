@@ -0,0 +1,59 @@
+"""Add indexes for hot chat and user queries
+
+Revision ID: b7e3c1d92f4a
+Revises: 3637f9b77e29
+Create Date: 2026-10-17 09:12:31.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c1d92f4a'
+down_revision: Union[str, None] = '3637f9b77e29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        # Session history and keyset pagination: WHERE session_id = ? ORDER BY created_at, id
+        op.create_index(
+            'ix_chat_messages_session_id_created_at', 'chat_messages',
+            ['session_id', 'created_at', 'id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        # Sidebar: WHERE user_id = ? ORDER BY created_at DESC
+        op.create_index(
+            'ix_chat_sessions_user_id_created_at', 'chat_sessions',
+            ['user_id', 'created_at'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        # get_or_create_chat_session lookup by upstream session id
+        op.create_index(
+            'ix_chat_sessions_external_session_id', 'chat_sessions',
+            ['external_session_id'],
+            postgresql_where=sa.text('external_session_id IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        # Email verification / password reset lookup; most rows have no token
+        op.create_index(
+            'ix_users_verification_token', 'users',
+            ['verification_token'],
+            postgresql_where=sa.text('verification_token IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_verification_token', table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_chat_sessions_external_session_id', table_name='chat_sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_chat_sessions_user_id_created_at', table_name='chat_sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_chat_messages_session_id_created_at', table_name='chat_messages', postgresql_concurrently=True, if_exists=True)
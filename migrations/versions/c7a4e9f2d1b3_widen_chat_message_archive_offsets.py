@@ -0,0 +1,30 @@
+"""Widen chat_message_archives offset and length to bigint
+
+Revision ID: c7a4e9f2d1b3
+Revises: e41c7d2a5b86
+Create Date: 2026-10-17 21:04:12.540318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a4e9f2d1b3'
+down_revision: Union[str, None] = 'e41c7d2a5b86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('chat_message_archives', 'offset', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=True)
+    op.alter_column('chat_message_archives', 'length', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('chat_message_archives', 'length', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=True)
+    op.alter_column('chat_message_archives', 'offset', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=True)
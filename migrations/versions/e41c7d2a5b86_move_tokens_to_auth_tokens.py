@@ -0,0 +1,65 @@
+"""Move verification and reset tokens from users to hashed auth_tokens
+
+Revision ID: e41c7d2a5b86
+Revises: 8b3f6a1d9c52
+Create Date: 2026-10-17 19:12:30.884017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41c7d2a5b86'
+down_revision: Union[str, None] = '8b3f6a1d9c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('auth_tokens',
+    sa.Column('token_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('purpose', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('token_hash')
+    )
+    op.create_index('ix_auth_tokens_user_id_purpose', 'auth_tokens', ['user_id', 'purpose'], unique=False)
+    op.create_index('ix_auth_tokens_expires_at', 'auth_tokens', ['expires_at'], unique=False)
+
+    # Keep outstanding links working. The old column did not record what a
+    # token was for: unverified users were waiting on a verification link,
+    # verified users can only have asked for a password reset.
+    op.execute("""
+        INSERT INTO auth_tokens (token_hash, purpose, user_id, expires_at, created_at)
+        SELECT encode(sha256(convert_to(verification_token, 'UTF8')), 'hex'),
+               CASE WHEN is_verified THEN 'reset_password' ELSE 'verify_email' END,
+               id,
+               now() AT TIME ZONE 'utc' + CASE WHEN is_verified THEN interval '1 hour' ELSE interval '48 hours' END,
+               now() AT TIME ZONE 'utc'
+        FROM users
+        WHERE verification_token IS NOT NULL
+        ON CONFLICT (token_hash) DO NOTHING
+    """)
+
+    op.drop_index('ix_users_verification_token', table_name='users', postgresql_where=sa.text('verification_token IS NOT NULL'))
+    op.drop_column('users', 'verification_token')
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Only hashes are stored, so outstanding tokens cannot be copied back and
+    their links stop working.
+    """
+    op.add_column('users', sa.Column('verification_token', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.create_index('ix_users_verification_token', 'users', ['verification_token'], unique=False, postgresql_where=sa.text('verification_token IS NOT NULL'))
+    op.drop_index('ix_auth_tokens_expires_at', table_name='auth_tokens')
+    op.drop_index('ix_auth_tokens_user_id_purpose', table_name='auth_tokens')
+    op.drop_table('auth_tokens')
@@ -0,0 +1,109 @@
+"""
+Login-storm benchmark: does a burst of sign-ins slow down everything else?
+
+Measures the latency of a cheap authenticated chat endpoint on its own, then
+again while BENCH_LOGIN_CONCURRENCY clients hammer /auth/signin. With bcrypt
+off the event loop the two distributions should be close; sign-ins beyond the
+hashing pool's capacity come back as 503 instead of stalling the worker.
+
+    BENCH_EMAIL=user@example.com BENCH_PASSWORD=secret \\
+        python -m scripts.bench_login_storm
+
+The account must exist and be verified. Settings are read from BENCH_BASE_URL
+(default http://localhost:10000), BENCH_DURATION (seconds per phase),
+BENCH_LOGIN_CONCURRENCY and BENCH_PROBE_PATH (default the session list).
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://localhost:10000")
+PREFIX = "/api/v1"
+EMAIL = os.getenv("BENCH_EMAIL")
+PASSWORD = os.getenv("BENCH_PASSWORD")
+DURATION = float(os.getenv("BENCH_DURATION", "10"))
+LOGIN_CONCURRENCY = int(os.getenv("BENCH_LOGIN_CONCURRENCY", "50"))
+PROBE_PATH = os.getenv("BENCH_PROBE_PATH", f"{PREFIX}/chat/sessions")
+PROBE_INTERVAL = 0.05
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "no samples"
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+    return f"n={len(ordered)} p50={pick(0.5):.1f}ms p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms max={ordered[-1] * 1000:.1f}ms"
+
+
+async def login(client: httpx.AsyncClient) -> httpx.Response:
+    return await client.post(f"{PREFIX}/auth/signin", json={"email": EMAIL, "password": PASSWORD})
+
+
+async def probe(client: httpx.AsyncClient, token: str, deadline: float) -> list:
+    """Hit the probe endpoint at a steady rate and record each latency."""
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = await client.get(PROBE_PATH, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            print(f"probe returned {response.status_code}")
+        await asyncio.sleep(PROBE_INTERVAL)
+    return latencies
+
+
+async def storm(client: httpx.AsyncClient, deadline: float, statuses: Counter, latencies: list):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await login(client)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+
+async def main() -> int:
+    if not EMAIL or not PASSWORD:
+        print("Set BENCH_EMAIL and BENCH_PASSWORD to a verified account")
+        return 2
+
+    limits = httpx.Limits(max_connections=LOGIN_CONCURRENCY + 10)
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60, limits=limits) as client:
+        response = await login(client)
+        if response.status_code != 200:
+            print(f"Sign-in failed with {response.status_code}: {response.text}")
+            return 2
+        # The token is only handed out as a cookie
+        token = response.cookies.get("access_token")
+
+        baseline = await probe(client, token, time.monotonic() + DURATION)
+
+        statuses: Counter = Counter()
+        login_latencies: list = []
+        deadline = time.monotonic() + DURATION
+        results = await asyncio.gather(
+            probe(client, token, deadline),
+            *(storm(client, deadline, statuses, login_latencies) for _ in range(LOGIN_CONCURRENCY)),
+        )
+        under_storm = results[0]
+
+        hasher = (await client.get("/health/auth")).json().get("password_hasher")
+
+    print(f"probe {PROBE_PATH}")
+    print(f"  baseline     {percentiles(baseline)}")
+    print(f"  login storm  {percentiles(under_storm)}")
+    print(f"sign-in x{LOGIN_CONCURRENCY}  {percentiles(login_latencies)}")
+    print(f"  statuses     {dict(statuses)}")
+    print(f"password hasher {hasher}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,165 @@
+"""
+Query-plan audit for the hot chat and user queries.
+
+Recreates the schema from ``src.db.models`` in a local Postgres, seeds it with
+enough rows for the planner to prefer indexes, then runs ``EXPLAIN ANALYZE``
+for every query in HOT_QUERIES. Exits non-zero if any plan contains a
+sequential scan.
+
+    EXPLAIN_DATABASE_URL=postgresql+asyncpg://postgres@localhost:5432/govllminer_explain \\
+        python -m scripts.explain_hot_queries
+
+The target database is dropped and recreated table by table, so the script
+refuses to run against anything but localhost.
+"""
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import urlparse
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+
+from src.db import models  # noqa: F401  (registers the tables on SQLModel.metadata)
+from src.db.partitions import ensure_future_partitions
+
+
+DATABASE_URL = os.getenv(
+    "EXPLAIN_DATABASE_URL", "postgresql+asyncpg://postgres@localhost:5432/govllminer_explain"
+)
+USERS = int(os.getenv("EXPLAIN_USERS", "2000"))
+SESSIONS_PER_USER = int(os.getenv("EXPLAIN_SESSIONS_PER_USER", "10"))
+MESSAGES_PER_SESSION = int(os.getenv("EXPLAIN_MESSAGES_PER_SESSION", "20"))
+
+SEED = [
+    """
+    INSERT INTO users (id, email, password, full_name, is_verified, created_at, updated_at)
+    SELECT gen_random_uuid(), 'user' || g || '@example.com', 'x', 'User ' || g,
+           g % 10 <> 0, now(), now()
+    FROM generate_series(1, :users) AS g
+    """,
+    """
+    INSERT INTO auth_tokens (token_hash, purpose, user_id, expires_at, created_at)
+    SELECT encode(sha256(u.id::text::bytea), 'hex'),
+           CASE WHEN u.is_verified THEN 'reset_password' ELSE 'verify_email' END,
+           u.id, now() + interval '1 hour', now()
+    FROM users u
+    """,
+    """
+    INSERT INTO chat_sessions (id, user_id, session_name, external_session_id, created_at, updated_at,
+                               message_count, last_message_at, last_message_preview)
+    SELECT gen_random_uuid(), u.id, 'Session ' || g,
+           CASE WHEN g % 4 <> 0 THEN md5(u.id::text || g) END,
+           now() - g * interval '1 hour', now(),
+           CAST(:messages AS int), now() - g * interval '1 hour' + make_interval(secs => CAST(:messages AS int)), 'lorem ipsum'
+    FROM users u, generate_series(1, :sessions) AS g
+    """,
+    """
+    INSERT INTO chat_messages (id, session_id, sender, content, created_at)
+    SELECT gen_random_uuid(), s.id, CASE WHEN g % 2 = 0 THEN 'ai' ELSE 'user' END,
+           repeat('lorem ipsum ', 8), s.created_at + g * interval '1 second'
+    FROM chat_sessions s, generate_series(1, :messages) AS g
+    """,
+]
+
+# name -> (query, lookup used to pick realistic parameters)
+HOT_QUERIES = {
+    "messages_by_session": (
+        "SELECT * FROM chat_messages WHERE session_id = :session_id ORDER BY created_at, id LIMIT 21",
+        "SELECT id AS session_id FROM chat_sessions OFFSET 1000 LIMIT 1",
+    ),
+    "sessions_by_user": (
+        "SELECT * FROM chat_sessions WHERE user_id = :user_id AND deleted_at IS NULL"
+        " ORDER BY last_message_at DESC",
+        "SELECT id AS user_id FROM users OFFSET 100 LIMIT 1",
+    ),
+    "session_by_external_id": (
+        "SELECT * FROM chat_sessions WHERE external_session_id = :external_session_id",
+        "SELECT external_session_id FROM chat_sessions WHERE external_session_id IS NOT NULL LIMIT 1",
+    ),
+    "consume_auth_token": (
+        "DELETE FROM auth_tokens WHERE token_hash = :token_hash AND purpose = :purpose"
+        " AND expires_at > now() RETURNING user_id",
+        "SELECT token_hash, purpose FROM auth_tokens OFFSET 100 LIMIT 1",
+    ),
+    "expired_auth_tokens": (
+        "SELECT token_hash FROM auth_tokens WHERE expires_at <= now() LIMIT 5000",
+        "SELECT 1",
+    ),
+}
+
+
+def sequential_scans(plan: dict) -> list:
+    """
+    Relations read with a Seq Scan anywhere in the plan tree. Scans that read no
+    rows at all (empty chat_messages partitions for future months) are ignored.
+    """
+    found = []
+    read = plan.get("Actual Rows", 0) + plan.get("Rows Removed by Filter", 0)
+    if plan.get("Node Type") == "Seq Scan" and read > 0:
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(sequential_scans(child))
+    return found
+
+
+def summarize(plan: dict, depth: int = 0) -> list:
+    line = "  " * depth + plan["Node Type"]
+    if plan.get("Index Name"):
+        line += f" using {plan['Index Name']}"
+    if plan.get("Relation Name"):
+        line += f" on {plan['Relation Name']}"
+    line += f" (rows={plan.get('Actual Rows')}, time={plan.get('Actual Total Time')}ms)"
+    lines = [line]
+    for child in plan.get("Plans", []):
+        lines.extend(summarize(child, depth + 1))
+    return lines
+
+
+async def main() -> int:
+    host = urlparse(DATABASE_URL.replace("+asyncpg", "")).hostname
+    if host not in ("localhost", "127.0.0.1", "::1"):
+        print(f"Refusing to reset non-local database at {host}")
+        return 2
+
+    engine = create_async_engine(DATABASE_URL)
+    failures = []
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+        await ensure_future_partitions(engine)
+
+        async with engine.begin() as conn:
+            params = {"users": USERS, "sessions": SESSIONS_PER_USER, "messages": MESSAGES_PER_SESSION}
+            for statement in SEED:
+                await conn.execute(text(statement), params)
+
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("ANALYZE"))
+
+            for name, (query, lookup) in HOT_QUERIES.items():
+                row = (await conn.execute(text(lookup))).mappings().first()
+                result = await conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"), dict(row))
+                document = result.scalar()
+                plan = (json.loads(document) if isinstance(document, str) else document)[0]["Plan"]
+
+                scans = sequential_scans(plan)
+                print(f"{'FAIL' if scans else 'ok  '} {name}")
+                for line in summarize(plan):
+                    print(f"       {line}")
+                if scans:
+                    failures.append((name, scans))
+    finally:
+        await engine.dispose()
+
+    for name, scans in failures:
+        print(f"{name}: sequential scan on {', '.join(scans)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,115 @@
+"""
+Local stand-in for the bizllminer upstream with injectable latency and errors.
+
+Run it and point the backend at it:
+
+    uvicorn scripts.fake_upstream:app --port 9000
+    UPSTREAM_BASE_URL=http://localhost:9000 python main.py
+
+Faults are read from FAKE_LATENCY, FAKE_JITTER (seconds) and FAKE_ERROR_RATE
+(0-1) at startup and can be changed while running:
+
+    curl -X POST 'localhost:9000/_fault?latency=3&error_rate=0.5'
+"""
+import asyncio
+import json
+import os
+import random
+import uuid
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+
+app = FastAPI(title="Fake bizllminer upstream")
+
+faults = {
+    "latency": float(os.getenv("FAKE_LATENCY", "0.05")),
+    "jitter": float(os.getenv("FAKE_JITTER", "0")),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+}
+calls = {"total": 0, "failed": 0}
+
+
+async def inject_faults():
+    calls["total"] += 1
+    await asyncio.sleep(faults["latency"] + random.uniform(0, faults["jitter"]))
+    if random.random() < faults["error_rate"]:
+        calls["failed"] += 1
+        raise HTTPException(status_code=503, detail="Injected upstream failure")
+
+
+@app.post("/_fault")
+async def set_faults(latency: float = None, jitter: float = None, error_rate: float = None):
+    for key, value in (("latency", latency), ("jitter", jitter), ("error_rate", error_rate)):
+        if value is not None:
+            faults[key] = value
+    return {"faults": faults, "calls": calls}
+
+
+@app.get("/_stats")
+async def stats():
+    return {"faults": faults, "calls": calls}
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    payload = await request.json()
+    await inject_faults()
+    session_id = payload.get("session_id") or str(uuid.uuid4())
+    answer = f"Echo: {payload.get('message', '')}. This is a fake upstream answer."
+
+    if not payload.get("stream"):
+        return {"response": answer, "session_id": session_id}
+
+    async def events():
+        for word in answer.split(" "):
+            yield f"data: {json.dumps({'token': word + ' ', 'session_id': session_id})}\n\n"
+            await asyncio.sleep(0.01)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/chat/upload")
+async def chat_upload(request: Request):
+    form = await request.form()
+    await inject_faults()
+    return {
+        "response": f"Received {form['file'].filename}: {form.get('message', '')}",
+        "session_id": form.get("session_id") or str(uuid.uuid4()),
+    }
+
+
+@app.post("/upload")
+async def upload(request: Request):
+    form = await request.form()
+    await inject_faults()
+    return {"filename": form["file"].filename, "status": "success", "message": "File indexed"}
+
+
+@app.post("/query/rag")
+async def query_rag(request: Request):
+    payload = await request.json()
+    await inject_faults()
+    return {
+        "answer": f"Fake RAG answer for: {payload.get('query')}",
+        "session_id": str(uuid.uuid4()),
+        "top_documents": [
+            {"id": i, "source": f"doc-{i}.pdf", "score": 1 - i / 10, "text": "Lorem ipsum"}
+            for i in range(payload.get("rerank_k", 3))
+        ],
+    }
+
+
+@app.post("/query/direct")
+async def query_direct(request: Request):
+    payload = await request.json()
+    await inject_faults()
+    return {"answer": f"Fake direct answer for: {payload.get('query')}", "session_id": str(uuid.uuid4())}
+
+
+@app.get("/features")
+async def features():
+    await inject_faults()
+    return {"features": ["policy", "budget", "health", "education"]}
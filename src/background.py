@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+
+logger = logging.getLogger("govllminer.background")
+
+
+class PeriodicTask:
+    """
+    Runs ``func`` every ``interval`` seconds on the event loop until stopped.
+
+    The first run happens right after ``start()`` so work left over from a
+    previous process is picked up at startup. Failures are logged and counted;
+    they never stop the loop.
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[object]]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_run: Optional[float] = None
+        self.last_result: object = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(), name=self.name)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self) -> object:
+        self.runs += 1
+        self.last_run = time.time()
+        try:
+            self.last_result = await self.func()
+        except Exception:
+            self.failures += 1
+            logger.exception("Periodic task %s failed", self.name)
+            return None
+        return self.last_result
+
+    async def _loop(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+        }
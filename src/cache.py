@@ -0,0 +1,190 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+logger = logging.getLogger("govllminer.cache")
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with LRU eviction and per-entry expiry.
+
+    Entries expire ``ttl`` seconds after they are written (``None`` keeps them
+    until evicted). When ``maxsize`` is reached the least recently used entry is
+    dropped. A ``maxsize`` of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class ExpiringMap:
+    """
+    Unbounded map whose entries only leave when they expire, for data that
+    must not be lost to LRU eviction (token revocations). It stays small as
+    long as writes are rare compared to the TTL.
+    """
+
+    def __init__(self):
+        self._data: dict = {}
+        self._expiry: list = []
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[1] <= time.monotonic():
+            return default
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        self._prune()
+        expires_at = time.monotonic() + ttl
+        self._data[key] = (value, expires_at)
+        heapq.heappush(self._expiry, (expires_at, key))
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        self._prune()
+        return {"size": len(self._data)}
+
+
+class StaleWhileRevalidate:
+    """
+    A single cached value that is served immediately and refreshed in the
+    background once it is older than ``ttl`` seconds.
+
+    Only the very first load waits on the fetch. A failed background refresh
+    keeps serving the last good value, so an upstream outage does not surface
+    to callers once the value has been loaded.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value: Any = _MISSING
+        self._fetched_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_failures = 0
+
+    @property
+    def age(self) -> Optional[float]:
+        if self._value is _MISSING:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    async def get(self, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if self._value is _MISSING:
+            self.misses += 1
+            # Concurrent cold callers share the first load
+            return await asyncio.shield(self._start_refresh(fetch))
+
+        if self.age > self.ttl:
+            self.stale_hits += 1
+            self._start_refresh(fetch)
+        else:
+            self.hits += 1
+        return self._value
+
+    def _start_refresh(self, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.ensure_future(self._load(fetch))
+        return self._refresh
+
+    async def _load(self, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except Exception as e:
+            self.refresh_failures += 1
+            if self._value is _MISSING:
+                raise
+            logger.warning("Background refresh failed, serving last good value: %s", e)
+            return self._value
+        self._value = value
+        self._fetched_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        self._value = _MISSING
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "age": round(self.age, 2) if self.age is not None else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_failures": self.refresh_failures,
+        }
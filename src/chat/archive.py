@@ -0,0 +1,389 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import aiofiles
+from sqlalchemy import and_, delete, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.config import settings
+from src.db.main import engine, async_session_maker
+from src.db.models import ChatMessage, ChatMessageArchive, ChatSession
+from src.db import partitions
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # Parquet archives are optional
+    pyarrow = None
+    parquet = None
+
+
+logger = logging.getLogger("govllminer.archive")
+
+COLUMNS = ("id", "session_id", "sender", "content", "created_at")
+
+
+class MessageArchive:
+    """
+    Moves old monthly chat_messages partitions to files on disk and brings a
+    session's messages back when it is opened.
+
+    NDJSON archives are gzip files with one gzip member per session, so the
+    manifest (chat_message_archives) can point at a byte range and a restore
+    only decompresses that session. The file as a whole is still a regular
+    ``.ndjson.gz``.
+    """
+
+    def __init__(self, directory: Optional[str] = None, archive_format: Optional[str] = None):
+        self.directory = directory or settings.CHAT_ARCHIVE_DIR
+        self.format = (archive_format or settings.CHAT_ARCHIVE_FORMAT).lower()
+        if self.format == "parquet" and pyarrow is None:
+            logger.warning("pyarrow is not installed, archiving chat messages as NDJSON")
+            self.format = "ndjson"
+        # Sessions recently checked and found to have nothing archived
+        self._clean = TTLCache(maxsize=10000, ttl=600)
+        self.archived_partitions = 0
+        self.archived_messages = 0
+        self.restored_sessions = 0
+        self.purged_sessions = 0
+
+    # ------------------------------------------------------------------ archive
+
+    async def archive_old_partitions(self) -> List[str]:
+        """
+        Detach monthly partitions older than CHAT_ARCHIVE_AFTER_MONTHS, export
+        them, record them in the manifest and drop them. Partitions left detached
+        by an interrupted run are finished as well.
+        """
+        cutoff = partitions.add_months(
+            partitions.month_start(datetime.utcnow()), -settings.CHAT_ARCHIVE_AFTER_MONTHS
+        )
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await partitions.is_partitioned(conn):
+                return []
+
+            expired = [
+                name for name in await partitions.attached_partitions(conn)
+                if (partitions.partition_month(name) or cutoff) < cutoff
+            ]
+
+        for name in expired:
+            # DETACH ... CONCURRENTLY is not allowed next to a default partition,
+            # so keep the exclusive lock short instead. SET LOCAL ends with the
+            # transaction and never reaches the next user of the connection.
+            async with engine.begin() as conn:
+                await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                await conn.execute(text(f"ALTER TABLE {partitions.PARENT_TABLE} DETACH PARTITION {name}"))
+            logger.info("Detached partition %s", name)
+
+        async with engine.connect() as conn:
+            pending = await partitions.detached_partitions(conn)
+
+        archived = []
+        for name in pending:
+            await self._archive_table(name)
+            archived.append(name)
+        return archived
+
+    async def _archive_table(self, name: str):
+        os.makedirs(self.directory, exist_ok=True)
+        extension = "parquet" if self.format == "parquet" else "ndjson.gz"
+        path = os.path.join(self.directory, f"{name}.{extension}")
+        tmp_path = f"{path}.tmp"
+
+        query = text(
+            f"SELECT {', '.join(COLUMNS)} FROM {name} ORDER BY session_id, created_at, id"
+        ).execution_options(yield_per=settings.CHAT_EXPORT_BATCH_SIZE)
+        async with engine.connect() as conn:
+            result = await conn.stream(query)
+            if self.format == "parquet":
+                manifest = await self._write_parquet(result, tmp_path)
+            else:
+                manifest = await self._write_ndjson(result, tmp_path)
+            exported = sum(entry["message_count"] for entry in manifest)
+            expected = (await conn.execute(text(f"SELECT count(*) FROM {name}"))).scalar()
+            await conn.rollback()
+
+        if exported != expected:
+            os.remove(tmp_path)
+            raise RuntimeError(f"Exported {exported} of {expected} rows from {name}, keeping the table")
+        os.replace(tmp_path, path)
+
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            for start in range(0, len(manifest), 1000):
+                rows = [
+                    {**entry, "partition_name": name, "path": path, "archived_at": now, "restored_at": None}
+                    for entry in manifest[start:start + 1000]
+                ]
+                stmt = pg_insert(ChatMessageArchive).values(rows)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=["session_id", "partition_name"],
+                    set_={key: stmt.excluded[key] for key in ("path", "offset", "length", "message_count", "archived_at", "restored_at")},
+                ))
+            await session.execute(text(f"DROP TABLE {name}"))
+            await session.commit()
+
+        self.archived_partitions += 1
+        self.archived_messages += exported
+        logger.info("Archived %s messages from %s to %s", exported, name, path)
+
+    async def _write_ndjson(self, result, path: str) -> List[Dict]:
+        manifest: List[Dict] = []
+        offset = 0
+        current: Optional[uuid.UUID] = None
+        lines: List[str] = []
+
+        async with aiofiles.open(path, "wb") as out:
+            async def flush():
+                nonlocal offset
+                member = await asyncio.to_thread(gzip.compress, "".join(lines).encode())
+                await out.write(member)
+                manifest.append({
+                    "session_id": current, "offset": offset,
+                    "length": len(member), "message_count": len(lines),
+                })
+                offset += len(member)
+
+            async for row in result:
+                if current is not None and row.session_id != current:
+                    await flush()
+                    lines = []
+                current = row.session_id
+                lines.append(json.dumps({
+                    "id": str(row.id),
+                    "session_id": str(row.session_id),
+                    "sender": row.sender,
+                    "content": row.content,
+                    "created_at": row.created_at.isoformat(),
+                }) + "\n")
+            if lines:
+                await flush()
+            await out.flush()
+            await asyncio.to_thread(os.fsync, out.fileno())
+        return manifest
+
+    async def _write_parquet(self, result, path: str) -> List[Dict]:
+        counts: Dict[uuid.UUID, int] = {}
+        schema = pyarrow.schema([
+            ("id", pyarrow.string()), ("session_id", pyarrow.string()),
+            ("sender", pyarrow.string()), ("content", pyarrow.string()),
+            ("created_at", pyarrow.timestamp("us")),
+        ])
+        writer = parquet.ParquetWriter(path, schema, compression="zstd")
+        try:
+            async for batch in result.partitions():
+                for row in batch:
+                    counts[row.session_id] = counts.get(row.session_id, 0) + 1
+                table = pyarrow.Table.from_pydict({
+                    "id": [str(row.id) for row in batch],
+                    "session_id": [str(row.session_id) for row in batch],
+                    "sender": [row.sender for row in batch],
+                    "content": [row.content for row in batch],
+                    "created_at": [row.created_at for row in batch],
+                }, schema=schema)
+                await asyncio.to_thread(writer.write_table, table)
+        finally:
+            await asyncio.to_thread(writer.close)
+        return [
+            {"session_id": session_id, "offset": None, "length": None, "message_count": count}
+            for session_id, count in counts.items()
+        ]
+
+    # ------------------------------------------------------------------ restore
+
+    async def pending(self, session_id: uuid.UUID, session: AsyncSession) -> bool:
+        """Whether some of the session's messages are archived and not yet restored."""
+        if self._clean.get(session_id):
+            return False
+        result = await session.execute(
+            select(ChatMessageArchive.partition_name)
+            .where(ChatMessageArchive.session_id == session_id, ChatMessageArchive.restored_at.is_(None))
+            .limit(1)
+        )
+        if result.first() is None:
+            self._clean.set(session_id, True)
+            return False
+        return True
+
+    async def restore_session(self, session_id: uuid.UUID) -> int:
+        """Load the session's archived messages back into chat_messages; returns the rows restored."""
+        restored = 0
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(ChatMessageArchive)
+                .where(ChatMessageArchive.session_id == session_id, ChatMessageArchive.restored_at.is_(None))
+                .with_for_update(skip_locked=True)
+            )
+            entries = result.scalars().all()
+            for entry in entries:
+                messages = await self._read(entry)
+                for start in range(0, len(messages), 1000):
+                    stmt = pg_insert(ChatMessage).values(messages[start:start + 1000])
+                    await session.execute(stmt.on_conflict_do_nothing())
+                restored += len(messages)
+
+            if entries:
+                await session.execute(
+                    update(ChatMessageArchive)
+                    .where(
+                        ChatMessageArchive.session_id == session_id,
+                        ChatMessageArchive.partition_name.in_([entry.partition_name for entry in entries]),
+                    )
+                    .values(restored_at=datetime.utcnow())
+                )
+            await session.commit()
+
+        if restored:
+            self.restored_sessions += 1
+            logger.info("Restored %s archived messages for session %s", restored, session_id)
+        return restored
+
+    async def _read(self, entry: ChatMessageArchive) -> List[Dict]:
+        if entry.path.endswith(".parquet"):
+            if parquet is None:
+                raise RuntimeError(f"pyarrow is required to restore {entry.path}")
+            table = await asyncio.to_thread(
+                parquet.read_table, entry.path, filters=[("session_id", "=", str(entry.session_id))]
+            )
+            rows = table.to_pylist()
+        else:
+            async with aiofiles.open(entry.path, "rb") as source:
+                await source.seek(entry.offset)
+                member = await source.read(entry.length)
+            data = await asyncio.to_thread(gzip.decompress, member)
+            rows = [json.loads(line) for line in data.decode().splitlines() if line]
+
+        return [
+            {
+                "id": uuid.UUID(row["id"]),
+                "session_id": uuid.UUID(row["session_id"]),
+                "sender": row["sender"],
+                "content": row["content"],
+                "created_at": row["created_at"] if isinstance(row["created_at"], datetime)
+                else datetime.fromisoformat(row["created_at"]),
+            }
+            for row in rows
+        ]
+
+    # ------------------------------------------------------------------ purge
+
+    async def purge_deleted_sessions(self) -> int:
+        """
+        Remove the archived messages of sessions marked deleted: their manifest
+        rows and their bytes in the archive files. Run before the sessions
+        themselves are purged; returns the manifest rows removed.
+        """
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(ChatMessageArchive.path)
+                .join(ChatSession, ChatSession.id == ChatMessageArchive.session_id)
+                .where(ChatSession.deleted_at.is_not(None))
+                .distinct()
+            )
+            paths = result.scalars().all()
+
+        purged = 0
+        for path in paths:
+            purged += await self._purge_file(path)
+        if purged:
+            self.purged_sessions += purged
+            logger.info("Purged %s deleted sessions from %s archive files", purged, len(paths))
+        return purged
+
+    async def _purge_file(self, path: str) -> int:
+        """
+        Rewrite one archive file without the sessions that are deleted or gone,
+        or remove it when none is left. The rewrite goes to a new file that the
+        manifest switches to on commit, so a crash never leaves stale offsets.
+        """
+        live = and_(ChatSession.id == ChatMessageArchive.session_id, ChatSession.deleted_at.is_(None))
+        async with async_session_maker() as session:
+            # Locking the file's manifest rows also keeps restores of it out meanwhile
+            result = await session.execute(
+                select(ChatMessageArchive, ChatSession.id)
+                .outerjoin(ChatSession, live)
+                .where(ChatMessageArchive.path == path)
+                .with_for_update(of=ChatMessageArchive)
+            )
+            rows = result.all()
+            keep = [entry for entry, live_id in rows if live_id is not None]
+            doomed = len(rows) - len(keep)
+            if not doomed:
+                return 0
+
+            if keep:
+                directory, filename = os.path.split(path)
+                stem, extension = filename.split(".", 1)
+                new_path = os.path.join(directory, f"{stem.split('~', 1)[0]}~{uuid.uuid4().hex[:8]}.{extension}")
+                if path.endswith(".parquet"):
+                    await self._rewrite_parquet(path, new_path, {str(entry.session_id) for entry in keep})
+                else:
+                    positions = await asyncio.to_thread(self._rewrite_ndjson, path, new_path, keep)
+                    for entry in keep:
+                        entry.offset, entry.length = positions[entry.session_id]
+                for entry in keep:
+                    entry.path = new_path
+
+            await session.execute(
+                delete(ChatMessageArchive)
+                .where(
+                    ChatMessageArchive.path == path,
+                    ~select(ChatSession.id).where(live).exists(),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return doomed
+
+    @staticmethod
+    def _rewrite_ndjson(path: str, new_path: str, keep: List[ChatMessageArchive]) -> Dict[uuid.UUID, tuple]:
+        """Copy the gzip members of ``keep`` to ``new_path``; returns their new (offset, length)."""
+        positions: Dict[uuid.UUID, tuple] = {}
+        offset = 0
+        with open(path, "rb") as source, open(new_path, "wb") as out:
+            for entry in sorted(keep, key=lambda entry: entry.offset):
+                source.seek(entry.offset)
+                out.write(source.read(entry.length))
+                positions[entry.session_id] = (offset, entry.length)
+                offset += entry.length
+            out.flush()
+            os.fsync(out.fileno())
+        return positions
+
+    @staticmethod
+    async def _rewrite_parquet(path: str, new_path: str, session_ids: set):
+        if parquet is None:
+            raise RuntimeError(f"pyarrow is required to rewrite {path}")
+        table = await asyncio.to_thread(
+            parquet.read_table, path, filters=[("session_id", "in", list(session_ids))]
+        )
+        await asyncio.to_thread(parquet.write_table, table, new_path, compression="zstd")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.CHAT_ARCHIVE_ENABLED,
+            "format": self.format,
+            "directory": self.directory,
+            "archived_partitions": self.archived_partitions,
+            "archived_messages": self.archived_messages,
+            "restored_sessions": self.restored_sessions,
+            "purged_sessions": self.purged_sessions,
+        }
+
+
+message_archive = MessageArchive()
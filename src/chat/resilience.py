@@ -0,0 +1,327 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from src.config import settings
+from src.errors import UpstreamUnavailable
+
+
+logger = logging.getLogger("govllminer.resilience")
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with half-open probing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and every
+    call fails fast. Once ``reset_timeout`` seconds have passed a single probe is
+    let through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self):
+        """Give the half-open probe slot back when the allowed call is never made."""
+        self._probing = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit opened after %s consecutive failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of fast
+    responses and shrinks multiplicatively when latency exceeds the target or a
+    call fails. Calls beyond the current limit are rejected instead of queued.
+
+    The limit shrinks at most once per round trip: a slow or failed call that
+    was already in flight at the last decrease reflects the same congestion and
+    does not shrink it again.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, latency_target: float, backoff: float = 0.7):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.rejected = 0
+        self.last_decrease = float("-inf")
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float, ok: bool):
+        self.in_flight -= 1
+        if ok and latency <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            return
+        now = time.monotonic()
+        if now - latency <= self.last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.last_decrease = now
+
+    def abandon(self):
+        """Free the slot of a call that ended without telling anything about the upstream."""
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "latency_target": self.latency_target,
+        }
+
+
+class Hedger:
+    """
+    Decides when to send a backup copy of a slow idempotent request.
+
+    The hedge delay is a percentile of recent successful latencies. Each primary
+    request earns ``budget`` tokens and each hedge spends one, so hedges stay
+    below roughly ``budget`` extra requests overall.
+    """
+
+    def __init__(self, percentile: float, budget: float, min_samples: int, window: int = 200):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies: deque = deque(maxlen=window)
+        self.tokens = 0.0
+        self.fired = 0
+        self.won = 0
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def earn(self):
+        self.tokens = min(10.0, self.tokens + self.budget)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.fired += 1
+        return True
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        return {
+            "delay": round(delay, 3) if delay is not None else None,
+            "samples": len(self.latencies),
+            "fired": self.fired,
+            "won": self.won,
+        }
+
+
+class EndpointGuard:
+    """
+    Resilience policy for one upstream endpoint family: circuit breaker, AIMD
+    concurrency limit and, for idempotent calls only, retries with full jitter
+    and optional hedging.
+    """
+
+    def __init__(self, name: str, latency_target: float):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.UPSTREAM_BREAKER_RESET_TIMEOUT,
+        )
+        self.limiter = AdaptiveLimiter(
+            min_limit=settings.UPSTREAM_CONCURRENCY_MIN,
+            max_limit=settings.UPSTREAM_CONCURRENCY_MAX,
+            latency_target=latency_target,
+        )
+        self.hedger = Hedger(
+            percentile=settings.UPSTREAM_HEDGE_PERCENTILE,
+            budget=settings.UPSTREAM_HEDGE_BUDGET,
+            min_samples=settings.UPSTREAM_HEDGE_MIN_SAMPLES,
+        )
+        self.retries = 0
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        idempotent: bool = False,
+    ) -> httpx.Response:
+        """
+        Run ``send`` under the guard. ``send`` must build a fresh request on every
+        call so it can be retried or hedged. Raises ``UpstreamUnavailable`` without
+        calling the upstream when the breaker is open or the concurrency limit is
+        reached.
+        """
+        attempts = settings.UPSTREAM_RETRY_ATTEMPTS + 1 if idempotent else 1
+        hedge = idempotent and settings.UPSTREAM_HEDGING
+
+        for attempt in range(1, attempts + 1):
+            response = None
+            error: Optional[Exception] = None
+            try:
+                response = await self._attempt(self._hedged(send) if hedge else send)
+            except httpx.TransportError as e:
+                error = e
+
+            retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt == attempts:
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                await response.aclose()
+            self.retries += 1
+            # Full jitter: sleep a random fraction of the exponential backoff
+            await asyncio.sleep(random.uniform(0, settings.UPSTREAM_RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(message=f"Upstream {self.name} circuit is open")
+        if not self.limiter.try_acquire():
+            self.breaker.release_probe()
+            raise UpstreamUnavailable(message=f"Upstream {self.name} concurrency limit reached")
+
+        started = time.monotonic()
+        try:
+            response = await send()
+        except (httpx.TransportError, asyncio.TimeoutError):
+            self._record(started, ok=False)
+            raise
+        except BaseException:
+            # Cancelled (client gone, losing hedge or single-flight caller) or a
+            # local error: nothing was learned about the upstream
+            self.limiter.abandon()
+            self.breaker.release_probe()
+            raise
+        self._record(started, ok=response.status_code < 500)
+        return response
+
+    def _record(self, started: float, ok: bool):
+        self.limiter.release(time.monotonic() - started, ok)
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _hedged(self, send: Callable[[], Awaitable[httpx.Response]]) -> Callable[[], Awaitable[httpx.Response]]:
+        """
+        Wrap ``send`` so that a second identical request is fired when the first
+        has not answered within the hedge delay. The first successful response
+        wins and the other request is cancelled.
+        """
+        async def timed_send() -> httpx.Response:
+            started = time.monotonic()
+            response = await send()
+            if response.status_code < 500:
+                self.hedger.record(time.monotonic() - started)
+            return response
+
+        async def hedged_send() -> httpx.Response:
+            self.hedger.earn()
+            primary = asyncio.ensure_future(timed_send())
+            backup = None
+            winner = None
+            try:
+                delay = self.hedger.delay()
+                if delay is None:
+                    winner = primary
+                    return await primary
+
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if done or not self.hedger.try_spend():
+                    winner = primary
+                    return await primary
+
+                backup = asyncio.ensure_future(timed_send())
+                pending = {primary, backup}
+                while pending and winner is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = next((task for task in done if task.exception() is None), None)
+                if winner is None:
+                    # Both copies failed: surface the primary's error
+                    return primary.result()
+                if winner is backup:
+                    self.hedger.won += 1
+                return winner.result()
+            finally:
+                # Also runs when the caller is cancelled mid-wait: asyncio.wait
+                # does not cancel the requests it waits on
+                for task in (primary, backup):
+                    if task is None or task is winner:
+                        continue
+                    if not task.done():
+                        task.cancel()
+                    elif not task.cancelled() and task.exception() is None:
+                        await task.result().aclose()
+
+        return hedged_send
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+            "retries": self.retries,
+            "hedging": self.hedger.stats(),
+        }
+
+
+guards: Dict[str, EndpointGuard] = {
+    name: EndpointGuard(name, latency_target)
+    for name, latency_target in settings.UPSTREAM_LATENCY_TARGETS.items()
+}
@@ -4,19 +4,22 @@ from src.users.auth import get_current_user
 from .service import ChatAPIClient
 from src.db.models import User
 from fastapi.responses import StreamingResponse
-import asyncio
 from typing import Annotated
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.db.main import get_session
+from src.db.main import get_session, get_read_session
 from uuid import UUID
 from src.db.models import ChatMessage, User
-from fastapi import Form, Request, File, HTTPException
+from fastapi import BackgroundTasks, Form, Request, Response, File, HTTPException, Query
 from .schemas import MessageSchemaModel, GroupedChatResponseModel, DocumentIDs, SessionSchemaModel, ChatMessageHistory, SessionListResponse, ChatSessionResponse, ChatGeneralResponse
 from .schemas import DirectQueryRequest, RagQueryRequest, ChatRequestSchema, ChatResponseSchema, TopDocument, UploadResponseSchema, RagQueryResponse, FeatureListResponse
 from src.users.schemas import TokenUser
-from src.errors import ChatAPIError
+from src.errors import ChatAPIError, InvalidToken, UpstreamUnavailable
 import uuid
 from typing import Optional, List
+import hashlib
+import json
+from datetime import datetime
+from src.config import settings
 
 
 chat_router = APIRouter()
@@ -55,13 +58,15 @@ async def handle_chat(
 
 
 @chat_router.post("/stream")
-async def handle_chat(
+async def handle_chat_stream(
     session: Annotated[AsyncSession, Depends(get_session)],
     request: ChatRequestSchema,
     current_user: TokenUser = Depends(get_current_user)
 ):
     """
-      Send a chat request to the external API and streams the response in a custom way.
+      Send a chat request to the external API and relay the answer as server-sent events
+      while it is being generated. The turn is saved once the upstream stream closes and
+      a final `done` event carries the chat session id.
       Args:
           message (str): The message to send in the request.
           token (str): The authorization token.
@@ -69,39 +74,58 @@ async def handle_chat(
           StreamingResponse: The response from the API.
     """
 
-    try:
-      response = await chat_client.send_chat_request(
+    upstream_response = await chat_client.open_chat_stream(
         session=session,
-        endpoint="chat", 
-        data={"message": request.message, 
-              "session_id": request.session_id, 
-              "document_id": request.document_id, 
+        endpoint="chat",
+        data={"message": request.message,
+              "session_id": request.session_id,
+              "document_id": request.document_id,
               "clear_history": request.clear_history
-            }, 
+            },
         current_user=current_user
-      )
-
-      async def event_stream():
-          for word in response["response"].split():
-              yield f"data: {word}\n\n"
-              await asyncio.sleep(0.05)
-
-      return StreamingResponse(
-          event_stream(),
-          media_type="text/event-stream",
-          headers={"X-Stream-ID": str(uuid.uuid4())}
-      )
-    except Exception as e:
-      raise ChatAPIError()
+    )
+
+    return StreamingResponse(
+        chat_client.relay_chat_stream(
+            upstream_response=upstream_response,
+            message=request.message,
+            local_session_id=request.session_id,
+            current_user=current_user
+        ),
+        media_type="text/event-stream",
+        headers={
+            "X-Stream-ID": str(uuid.uuid4()),
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 
 
 @chat_router.get("/{user_id}/chats", response_model=GroupedChatResponseModel)
 async def get_grouped_chats(
     user_id: UUID,
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    stream: bool = Query(False, description="Stream one session per line as NDJSON"),
+    limit: Optional[int] = Query(None, ge=1, description="Newest messages to return per session"),
+    since: Optional[datetime] = Query(None, description="Only messages created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages created before this time"),
 ):
-    return await chat_client.get_chats_by_user_grouped(user_id=user_id, session=session)
+    """
+    Get a user's messages grouped by session, most recently active session first.
+    With `stream=true` the sessions are sent as `application/x-ndjson` while
+    they are read, which keeps memory flat for long histories.
+    """
+    if stream:
+        return StreamingResponse(
+            chat_client.stream_chats_by_user_grouped(
+                user_id=user_id, limit=limit, since=since, until=until
+            ),
+            media_type="application/x-ndjson",
+        )
+    return await chat_client.get_chats_by_user_grouped(
+        user_id=user_id, session=session, limit=limit, since=since, until=until
+    )
 
 
 
@@ -111,7 +135,7 @@ async def get_grouped_chats(
 @chat_router.get("/sessions", response_model=SessionListResponse)
 async def get_user_sessions(
     user: TokenUser = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_read_session)
 ):
     """
     Get all sessions for a user.
@@ -124,36 +148,55 @@ async def get_user_sessions(
 
 
 @chat_router.get("/session/{session_id}", response_model=ChatSessionResponse)
-async def get_chat_by_session_id(session_id: str, session: AsyncSession = Depends(get_session)):
+async def get_chat_by_session_id(
+    session_id: str,
+    session: AsyncSession = Depends(get_read_session),
+    limit: Optional[int] = Query(None, ge=1, le=100, description="Number of turns per page"),
+    before: Optional[str] = Query(None, description="Cursor: return turns older than this"),
+    after: Optional[str] = Query(None, description="Cursor: return turns newer than this"),
+):
     """
     Get chats by session ID.
+    Pass `limit` to get the newest turns first and follow `next_cursor` with
+    `before` to scroll back (or with `after` to page forward). Without any of
+    these parameters the whole history is returned.
     """
     return await chat_client.get_chat_by_session_id(
         session_id=session_id,
-        session=session
+        session=session,
+        limit=limit,
+        before=before,
+        after=after
     )
 
 
 @chat_router.delete("/session/{session_id}", response_model=ChatGeneralResponse)
-async def delete_session(session_id: str, session: AsyncSession = Depends(get_session)):
+async def delete_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session),
+):
     """
     Delete a chat session.
     """
     return await chat_client.delete_session(
         session_id=session_id,
-        session=session
+        session=session,
+        background_tasks=background_tasks
     )
 
 
 
 @chat_router.post("/clear-chat", response_model=ChatGeneralResponse)
 async def clear_all_user_chats(
+    background_tasks: BackgroundTasks,
     user: TokenUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
     return await chat_client.clear_all_user_chats(
         user=user,
-        session=session
+        session=session,
+        background_tasks=background_tasks
     )
 
 
@@ -174,9 +217,10 @@ async def file_upload_with_chat(
     Upload a file to the chat service and save the chat interaction.
     """
 
-    if session_id not in (None, ""):
+    local_session_id = session_id or None
+    if local_session_id:
         session_id = await chat_client.replace_session_id_with_external_id(
-            session_id=session_id,
+            session_id=local_session_id,
             session=session
         )
 
@@ -193,6 +237,12 @@ async def file_upload_with_chat(
     )
 
     # Get or create the chat session
+    if local_session_id:
+        await chat_client.attach_external_session_id(
+            session=session,
+            local_session_id=local_session_id,
+            external_session_id=response.get("session_id")
+        )
     chat_session = await chat_client.get_or_create_chat_session(
         session=session,
         user_id=current_user.id,
@@ -279,6 +329,8 @@ async def query_rag(
             history=history[-2:]
         )
 
+    except (UpstreamUnavailable, InvalidToken):
+        raise
     except Exception as e:
         print(f"RAG query failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -321,27 +373,43 @@ async def query_direct(
             history=history[-2:]
         )
 
+    except (UpstreamUnavailable, InvalidToken):
+        raise
     except Exception as e:
         print(f"Direct query failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@chat_router.get("/list_features", response_model=FeatureListResponse)
 @chat_router.post("/list_features", response_model=FeatureListResponse)
 async def list_features(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    request: Request,
+    response: Response,
     current_user: TokenUser = Depends(get_current_user)
 ):
     """
       List all features.
+      The list is cached in-process and sent with ETag/Cache-Control headers, so a
+      GET with a matching If-None-Match is answered with 304 Not Modified.
       Returns:
           dict: The response from the API.
     """
     result = await chat_client.list_features_service(
-        session=session,
         endpoint="features",
         token=current_user.access_token
     )
 
+    features = result.get("features", [])
+    etag = '"' + hashlib.sha256(json.dumps(features).encode()).hexdigest()[:32] + '"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={int(settings.FEATURES_CACHE_TTL)}, stale-while-revalidate={int(settings.FEATURES_CACHE_TTL)}",
+    }
+
+    if request.method == "GET" and etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cache_headers)
+
+    response.headers.update(cache_headers)
     return FeatureListResponse(
-        features=result.get("features", [])
+        features=features
     )
@@ -139,6 +139,9 @@ class SessionResponse(BaseModel):
     user_id: Optional[UUID]
     session_name: Optional[str] = None
     created_at: datetime
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
 
 # For a list response
 class SessionListResponse(BaseModel):
@@ -155,6 +158,8 @@ class ChatSessionResponse(BaseModel):
     session_id: UUID
     session_name: Optional[str] = None
     chat_history: List[ChatTurn]
+    # Opaque keyset cursor for the next page in the same direction, None when exhausted
+    next_cursor: Optional[str] = None
 
 class ChatGeneralResponse(BaseModel):
     status: Optional[bool] = True
@@ -2,28 +2,133 @@ import httpx
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import StreamingResponse
-from src.db.models import ChatSession, User, ChatMessage
+from src.db.models import ChatSession, User, ChatMessage, ChatMessageArchive
 from src.db.models import  ChatMessage as ChatMessageDB
 import uuid
 from collections import deque
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func
-from typing import Optional, Dict, Any, List
+from sqlalchemy import and_, delete, func, insert, tuple_, update
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, AsyncIterator, Iterable, NamedTuple, Union
+from fastapi import BackgroundTasks
 from fastapi import UploadFile
 import re
+import json
+import base64
 
-from src.errors import ChatAPIError, NoChatHistoryFoundError, InvalidSessionId, DatabaseError, InvalidToken, ChatSessionSaveError, NoChatSessionsFound, FileUploadError, ChatUploadError, RAGQueryError, DirectQueryError
+from src.errors import ChatAPIError, NoChatHistoryFoundError, InvalidSessionId, DatabaseError, InvalidToken, ChatSessionSaveError, NoChatSessionsFound, FileUploadError, ChatUploadError, RAGQueryError, DirectQueryError, FileTooLarge, UpstreamUnavailable, InvalidCursor
 from sqlalchemy.exc import SQLAlchemyError
 from .schemas import FolderUploadCreateModel, SessionListResponse, SessionResponse, ChatSessionResponse, ChatGeneralResponse, GroupedChatResponseModel, SessionSchemaModel, MessageSchemaModel 
 from src.users.schemas import TokenUser
+from src.db.main import async_session_maker, replica_router
+from .transport import upstream, StreamingMultipart
+from src.config import settings
+from src.cache import TTLCache, StaleWhileRevalidate
+from .singleflight import SingleFlight
+from .resilience import guards
+from .archive import message_archive
 
 
+# Shared with folder ingestion, which clears it when new documents are indexed
+rag_cache = TTLCache(maxsize=settings.RAG_CACHE_MAXSIZE, ttl=settings.RAG_CACHE_TTL)
+# Bumped on every invalidation, so answers fetched before it are not cached after it
+rag_cache_generation = 0
+
+
+class SessionRef(NamedTuple):
+    """The immutable part of a ChatSession row, enough to continue a conversation."""
+    id: uuid.UUID
+    external_session_id: Optional[str]
+    session_name: Optional[str]
+    user_id: Optional[uuid.UUID]
+
+
+# Characters of the latest reply kept on ChatSession for the sidebar
+SESSION_PREVIEW_LENGTH = 200
+
+
+# Keyed by ChatSession.id and by ("external", external_session_id). The mapping
+# never changes after creation, so entries only leave on delete or LRU eviction.
+session_refs = TTLCache(maxsize=settings.SESSION_CACHE_MAXSIZE)
+
 
 class ChatAPIClient:
     def __init__(self):
-        self.base_url = "https://bizllminer.equalyz.ai"
-        self.client = httpx.AsyncClient()
+        self.base_url = upstream.base_url
+        # Identical query/direct and query/rag calls in flight share one upstream request
+        self.inflight = SingleFlight()
+        self.features_cache = StaleWhileRevalidate(ttl=settings.FEATURES_CACHE_TTL)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return upstream.client
+
+    def stats(self) -> dict:
+        """Upstream client statistics exposed on the health endpoint."""
+        return {
+            "pool": upstream.stats(),
+            "rag_cache": rag_cache.stats(),
+            "single_flight": self.inflight.stats(),
+            "features_cache": self.features_cache.stats(),
+            "session_cache": session_refs.stats(),
+            "endpoints": {name: guard.stats() for name, guard in guards.items()},
+        }
+
+    @staticmethod
+    def _without_session(result: dict) -> dict:
+        """Copy of a shared upstream result without the upstream session it belongs to."""
+        return {k: v for k, v in result.items() if k != "session_id"}
+
+    @staticmethod
+    def invalidate_rag_cache():
+        """Drop cached RAG answers after new documents have been ingested."""
+        global rag_cache_generation
+        rag_cache_generation += 1
+        rag_cache.clear()
+
+    @staticmethod
+    def _remember_session(chat_session: Union[ChatSession, SessionRef]) -> SessionRef:
+        ref = SessionRef(
+            id=chat_session.id,
+            external_session_id=chat_session.external_session_id,
+            session_name=chat_session.session_name,
+            user_id=chat_session.user_id,
+        )
+        session_refs.set(ref.id, ref)
+        if ref.external_session_id:
+            session_refs.set(("external", ref.external_session_id), ref)
+        return ref
+
+    @staticmethod
+    def _forget_session(session_id: uuid.UUID):
+        ref = session_refs.pop(session_id)
+        if ref is not None and ref.external_session_id:
+            session_refs.pop(("external", ref.external_session_id))
+
+    @classmethod
+    def forget_sessions(cls, session_ids: Iterable[uuid.UUID]):
+        """Evict deleted sessions from the mapping cache once the delete is committed."""
+        for session_id in session_ids:
+            cls._forget_session(session_id)
+
+    async def _get_session_ref(self, session_id, session: AsyncSession) -> Optional[SessionRef]:
+        """Resolve a local session id from the mapping cache, querying the DB only on a miss."""
+        session_id = session_id if isinstance(session_id, uuid.UUID) else uuid.UUID(str(session_id))
+        ref = session_refs.get(session_id)
+        if ref is not None:
+            return ref
+
+        result = await session.execute(
+            select(
+                ChatSession.id, ChatSession.external_session_id,
+                ChatSession.session_name, ChatSession.user_id,
+            ).where(ChatSession.id == session_id, ChatSession.deleted_at.is_(None))
+        )
+        row = result.first()
+        if row is None:
+            return None
+        return self._remember_session(SessionRef(*row))
 
     async def send_chat_request(
             self,
@@ -32,46 +137,33 @@ class ChatAPIClient:
             data: dict,
             current_user: TokenUser,
         ):
-            if data.get("session_id"):
+            local_session_id = data.get("session_id")
+            if local_session_id:
                 data["session_id"] = await self.replace_session_id_with_external_id(
-                    session_id=data.get("session_id"),
+                    session_id=local_session_id,
                     session=session
                 )
 
             try:
-                response = await self.client.post(
+                response = await guards["chat"].call(lambda: self.client.post(
                     f"{self.base_url}/{endpoint}",
                     json=data,
-                    headers={"Authorization": f"Bearer {current_user.access_token}"}
-                )
+                    headers={"Authorization": f"Bearer {current_user.access_token}"},
+                    timeout=upstream.timeout("chat")
+                ))
                 if response.status_code == 401:
                     raise InvalidToken()
                 response.raise_for_status()
                 result = response.json()
 
                 # Reuse or create chat session
-                chat_session = None
-
-                if data.get("session_id"):
-                    session_result = await session.execute(
-                        select(ChatSession).where(ChatSession.id == data.get("session_id"))
-                    )
-                    chat_session = session_result.scalar_one_or_none()
-                    if not chat_session:
-                        raise NoChatSessionsFound()
-                else:
-                    # New session
-                    
-                    match = re.match(r"^(.*?)[\.,]", result.get("response"))
-                    session_name = match.group(1) if match else result.get("response")[:50]
-
-                    chat_session = ChatSession(
-                        user_id=current_user.id,
-                        session_name=session_name,
-                        external_session_id=result.get("session_id")
-                    )
-                    session.add(chat_session)
-                    await session.flush()
+                chat_session = await self._resolve_chat_session(
+                    session=session,
+                    local_session_id=local_session_id,
+                    user_id=current_user.id,
+                    ai_response=result.get("response"),
+                    external_session_id=result.get("session_id")
+                )
 
                 # Save user + AI messages and return history
                 saved_session_id, chat_history = await self.save_full_chat_session(
@@ -89,67 +181,317 @@ class ChatAPIClient:
                     "chat_history": chat_history[-2:]
                 }
 
+            except UpstreamUnavailable:
+                raise
             except Exception as e:
                 print(f"[ChatAPI] Error during chat request: {e}")
                 raise ChatAPIError()
-            
+
+
+    async def _resolve_chat_session(
+            self,
+            session: AsyncSession,
+            local_session_id: Optional[uuid.UUID],
+            user_id: uuid.UUID,
+            ai_response: str,
+            external_session_id: Optional[str] = None,
+        ) -> Union[ChatSession, SessionRef]:
+        """
+        Look up the existing chat session for a follow-up message, or create a new
+        one named after the first sentence of the AI response.
+
+        Follow-ups are served from the mapping cache that
+        ``replace_session_id_with_external_id`` has just filled, so they normally
+        cost no query here.
+        """
+        if local_session_id:
+            chat_session = await self.attach_external_session_id(session, local_session_id, external_session_id)
+            if not chat_session:
+                raise NoChatSessionsFound()
+            return chat_session
+
+        # New session
+        match = re.match(r"^(.*?)[\.,]", ai_response or "")
+        session_name = match.group(1) if match else (ai_response or "")[:50]
+
+        chat_session = ChatSession(
+            user_id=user_id,
+            session_name=session_name,
+            external_session_id=external_session_id
+        )
+        session.add(chat_session)
+        await session.flush()
+        self._remember_session(chat_session)
+        return chat_session
+
+
+    async def attach_external_session_id(
+            self,
+            session: AsyncSession,
+            local_session_id,
+            external_session_id: Optional[str],
+        ) -> Optional[SessionRef]:
+        """
+        Record the upstream session of a follow-up on a chat session that has
+        none yet, and return the session. Nothing is committed.
+        """
+        ref = await self._get_session_ref(local_session_id, session)
+        if ref is None or ref.external_session_id is not None or not external_session_id:
+            return ref
+
+        await session.execute(
+            update(ChatSession)
+            .where(ChatSession.id == ref.id, ChatSession.external_session_id.is_(None))
+            .values(external_session_id=external_session_id)
+        )
+        return self._remember_session(ref._replace(external_session_id=external_session_id))
+
+
+    async def open_chat_stream(
+            self,
+            session: AsyncSession,
+            endpoint: str,
+            data: dict,
+            current_user: TokenUser,
+        ) -> httpx.Response:
+        """
+        Open a streaming request to the external chat API.
+
+        The upstream status is checked before any bytes are relayed, so auth and
+        upstream failures still surface as regular error responses.
+        """
+        if data.get("session_id"):
+            data["session_id"] = await self.replace_session_id_with_external_id(
+                session_id=data.get("session_id"),
+                session=session
+            )
+
+        request = self.client.build_request(
+            "POST",
+            f"{self.base_url}/{endpoint}",
+            json={**data, "stream": True},
+            headers={
+                "Authorization": f"Bearer {current_user.access_token}",
+                "Accept": "text/event-stream",
+            },
+            timeout=upstream.timeout("chat"),
+        )
+        try:
+            response = await guards["chat"].call(lambda: self.client.send(request, stream=True))
+        except httpx.HTTPError as e:
+            print(f"[ChatAPI] Error opening chat stream: {e}")
+            raise ChatAPIError()
+
+        if response.status_code == 401:
+            await response.aclose()
+            raise InvalidToken()
+        if response.status_code >= 400:
+            await response.aread()
+            await response.aclose()
+            print(f"[ChatAPI] Chat stream failed: {response.status_code} - {response.text}")
+            raise ChatAPIError()
+        return response
+
+
+    async def relay_chat_stream(
+            self,
+            upstream_response: httpx.Response,
+            message: str,
+            local_session_id: Optional[uuid.UUID],
+            current_user: TokenUser,
+        ) -> AsyncIterator[str]:
+        """
+        Forward upstream chunks as server-sent events as soon as they arrive, then
+        persist the assembled user/AI pair and emit a final ``done`` event.
+
+        SSE and plain chunked upstream responses are relayed incrementally; a plain
+        JSON response is forwarded as a single chunk.
+        """
+        chunks: List[str] = []
+        external_session_id = upstream_response.headers.get("x-session-id")
+        content_type = upstream_response.headers.get("content-type", "")
+
+        try:
+            if "text/event-stream" in content_type:
+                async for line in upstream_response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:]
+                    if payload.startswith(" "):
+                        payload = payload[1:]
+                    if payload.strip() == "[DONE]":
+                        break
+                    text, event_session_id = self._parse_stream_event(payload)
+                    external_session_id = event_session_id or external_session_id
+                    if text:
+                        chunks.append(text)
+                        yield self._format_sse(text)
+            elif "application/json" in content_type:
+                result = json.loads(await upstream_response.aread())
+                external_session_id = result.get("session_id") or external_session_id
+                text = result.get("response") or ""
+                chunks.append(text)
+                yield self._format_sse(text)
+            else:
+                async for text in upstream_response.aiter_text():
+                    if text:
+                        chunks.append(text)
+                        yield self._format_sse(text)
+        except httpx.HTTPError as e:
+            print(f"[ChatAPI] Chat stream interrupted: {e}")
+            yield self._format_sse("Error communicating with chat API", event="error")
+            return
+        finally:
+            await upstream_response.aclose()
+
+        ai_response = "".join(chunks)
+        try:
+            # The request-scoped session may already be closed once the response
+            # has started, so the turn is persisted with a session of its own.
+            async with async_session_maker() as db_session:
+                chat_session = await self._resolve_chat_session(
+                    session=db_session,
+                    local_session_id=local_session_id,
+                    user_id=current_user.id,
+                    ai_response=ai_response,
+                    external_session_id=external_session_id
+                )
+                saved_session_id, _ = await self.save_full_chat_session(
+                    session=db_session,
+                    chat_session=chat_session,
+                    user_message=message,
+                    ai_response=ai_response
+                )
+        except Exception as e:
+            print(f"[ChatAPI] Error saving streamed chat: {e}")
+            yield self._format_sse("Failed to save chat session or messages", event="error")
+            return
+
+        yield self._format_sse(
+            json.dumps({"session_id": str(saved_session_id), "session_name": chat_session.session_name}),
+            event="done"
+        )
+
+
+    @staticmethod
+    def _parse_stream_event(payload: str):
+        """Extract the text delta and optional session id from one upstream SSE payload."""
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return payload, None
+
+        if isinstance(event, str):
+            return event, None
+        if not isinstance(event, dict):
+            return payload, None
+
+        for key in ("token", "delta", "content", "response"):
+            if event.get(key) is not None:
+                return str(event[key]), event.get("session_id")
+        return "", event.get("session_id")
+
+
+    @staticmethod
+    def _format_sse(text: str, event: Optional[str] = None) -> str:
+        lines = "".join(f"data: {line}\n" for line in text.split("\n"))
+        if event:
+            return f"event: {event}\n{lines}\n"
+        return f"{lines}\n"
+
 
     async def save_full_chat_session(
             self, 
             session: AsyncSession, 
-            chat_session: ChatSession, 
+            chat_session: Union[ChatSession, SessionRef], 
             user_message: str, 
-            ai_response: str
+            ai_response: str,
+            history_turns: int = 0,
         ):
+        """
+        Save a user/AI message pair and bump the session's activity columns in one
+        statement (INSERT ... RETURNING with the UPDATE as a data-modifying CTE),
+        and return the new turn. Pass ``history_turns`` to get the last N turns of
+        the session instead (oldest first).
+        """
+        chat_session_id = chat_session.id
         try:
-            # Save user message
-            user_msg = ChatMessage(
-                session_id=chat_session.id,
-                sender="user",
-                content=user_message
+            now = datetime.utcnow()
+            # One microsecond later so the AI reply always sorts after the question
+            replied_at = now + timedelta(microseconds=1)
+            inserted = (
+                insert(ChatMessage)
+                .values([
+                    {"id": uuid.uuid4(), "session_id": chat_session.id, "sender": "user",
+                     "content": user_message, "created_at": now},
+                    {"id": uuid.uuid4(), "session_id": chat_session.id, "sender": "ai",
+                     "content": ai_response, "created_at": replied_at},
+                ])
+                .returning(ChatMessage.id, ChatMessage.sender, ChatMessage.content, ChatMessage.created_at)
+                .cte("inserted")
             )
-            session.add(user_msg)
-
-            # Save AI response
-            ai_msg = ChatMessage(
-                session_id=chat_session.id,
-                sender="ai",
-                content=ai_response
+            touched = (
+                update(ChatSession)
+                .where(ChatSession.id == chat_session.id)
+                .values(
+                    message_count=ChatSession.message_count + 2,
+                    last_message_at=replied_at,
+                    last_message_preview=(ai_response or "")[:SESSION_PREVIEW_LENGTH],
+                    updated_at=now,
+                )
+                .cte("touched")
             )
-            session.add(ai_msg)
+            result = await session.execute(select(inserted).add_cte(touched))
+            rows = sorted(result.all(), key=lambda row: row.created_at)
 
             await session.commit()
+            replica_router.mark_write(chat_session.user_id, chat_session_id)
             print(f"Saved session {chat_session.id} with user & AI messages.")
 
-            # Return updated history
-            chat_history = await self._get_chat_history(chat_session.id, session)
-            return chat_session.id, chat_history
+            if history_turns:
+                return chat_session.id, await self._get_chat_history(
+                    chat_session.id, session, limit=history_turns * 2
+                )
+
+            return chat_session.id, [self._history_entry(row) for row in rows]
 
         except Exception as e:
             await session.rollback()
+            # A session created in this transaction is gone again, and a cached one
+            # may have been deleted by another worker
+            self._forget_session(chat_session_id)
             print(f"[ChatAPI] Error saving messages: {e}")
             raise ChatSessionSaveError()
 
 
-    async def _get_chat_history(self, session_id: uuid.UUID, session: AsyncSession) -> List[Dict[str, Any]]:
-        """Retrieve chat history for a given session."""
+    @staticmethod
+    def _history_entry(message) -> Dict[str, Any]:
+        return {
+            "message_id": str(message.id),
+            "sender": message.sender,
+            "content": message.content,
+            "created_at": message.created_at
+        }
+
+
+    async def _get_chat_history(
+            self,
+            session_id: uuid.UUID,
+            session: AsyncSession,
+            limit: Optional[int] = None,
+        ) -> List[Dict[str, Any]]:
+        """Retrieve the chat history for a session, oldest first, optionally only the last ``limit`` messages."""
         query = (
             select(ChatMessage)
             .where(ChatMessage.session_id == session_id)
-            .order_by(ChatMessage.created_at.desc())
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
         )
+        if limit:
+            query = query.limit(limit)
         result = await session.execute(query)
         messages = result.scalars().all()
-        
-        history = []
-        for message in messages:
-            history.append({
-                "message_id": str(message.id),
-                "sender": message.sender,
-                "content": message.content,
-                "created_at": message.created_at
-            })
-        return history
+
+        return [self._history_entry(message) for message in reversed(messages)]
     
     async def replace_session_id_with_external_id(
             self,
@@ -158,16 +500,19 @@ class ChatAPIClient:
         ):
             """
             Replace the session ID with an external session ID.
+
+            Sessions started from a cached or shared answer have no upstream
+            session yet; None is returned for them so the upstream starts one,
+            which ``attach_external_session_id`` then records.
             """
 
             try:
-                result = await session.execute(
-                    select(ChatSession.external_session_id).where(ChatSession.id == session_id)
-                )
-                external_session_id_row = result.scalar_one_or_none()
-                if external_session_id_row is None:
+                ref = await self._get_session_ref(session_id, session)
+                if ref is None:
                     raise HTTPException(status_code=404, detail="Chat session not found")
-                external_session_id = str(external_session_id_row)
+                if ref.external_session_id is None:
+                    return None
+                external_session_id = str(ref.external_session_id)
                 print("External session ID:\n\n", external_session_id)
                 return external_session_id
             except Exception as e:
@@ -176,59 +521,141 @@ class ChatAPIClient:
 
 
 
+    @staticmethod
+    def _grouped_chats_query(
+        user_id: uuid.UUID,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        """
+        A user's messages ordered session by session (most recently active first),
+        newest message first within each session. ``limit`` keeps the newest N
+        messages per session; ``since``/``until`` bound ``created_at``.
+        """
+        newest_first = (ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        messages = (
+            select(
+                ChatSession.id.label("session_id"),
+                ChatSession.session_name,
+                ChatMessage.id.label("message_id"),
+                ChatMessage.sender,
+                ChatMessage.content,
+                ChatMessage.created_at,
+                func.row_number().over(
+                    partition_by=ChatMessage.session_id, order_by=newest_first
+                ).label("rank"),
+                func.max(ChatMessage.created_at).over(
+                    partition_by=ChatMessage.session_id
+                ).label("last_message_at"),
+            )
+            .join(ChatMessage, ChatSession.id == ChatMessage.session_id)
+            .where(ChatSession.user_id == user_id, ChatSession.deleted_at.is_(None))
+        )
+        if since is not None:
+            messages = messages.where(ChatMessage.created_at >= since)
+        if until is not None:
+            messages = messages.where(ChatMessage.created_at < until)
+        messages = messages.subquery()
+
+        query = select(
+            messages.c.session_id, messages.c.session_name, messages.c.message_id,
+            messages.c.sender, messages.c.content, messages.c.created_at,
+        )
+        if limit is not None:
+            query = query.where(messages.c.rank <= limit)
+        return query.order_by(
+            messages.c.last_message_at.desc(),
+            messages.c.session_id,
+            messages.c.created_at.desc(),
+            messages.c.message_id.desc(),
+        )
+
+    @staticmethod
+    def _session_from_row(row) -> SessionSchemaModel:
+        return SessionSchemaModel(session_id=row.session_id, session_name=row.session_name, messages=[])
+
+    @staticmethod
+    def _message_from_row(row) -> MessageSchemaModel:
+        return MessageSchemaModel(
+            message_id=row.message_id,
+            sender=row.sender,
+            content=row.content,
+            created_at=row.created_at
+        )
+
+    def _group_by_session(self, rows):
+        """Fold consecutive rows of one session into a SessionSchemaModel."""
+        current = None
+        for row in rows:
+            if current is None or current.session_id != row.session_id:
+                if current is not None:
+                    yield current
+                current = self._session_from_row(row)
+            current.messages.append(self._message_from_row(row))
+        if current is not None:
+            yield current
+
     async def get_chats_by_user_grouped(
         self,
         user_id: uuid.UUID,
         session: AsyncSession,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
     ) -> GroupedChatResponseModel:
         """
         Retrieve all chat messages grouped by session ID for a specific user,
         and return as a GroupedChatResponseModel.
         """
         try:
-            query = (
-                select(ChatSession.id, ChatSession.session_name, ChatMessage)
-                .join(ChatMessage, ChatSession.id == ChatMessage.session_id)
-                .where(ChatSession.user_id == user_id)
-                .order_by(ChatMessage.created_at.desc())
-            )
+            query = self._grouped_chats_query(user_id, limit=limit, since=since, until=until)
         except Exception:
             raise DatabaseError()
 
         result = await session.execute(query)
-        rows = result.all()
-
-        grouped_chats: dict[uuid.UUID, dict] = {}
-
-        for session_id, session_name, message in rows:
-            if session_id not in grouped_chats:
-                grouped_chats[session_id] = {
-                    "session_name": session_name,
-                    "messages": []
-                }
-
-            grouped_chats[session_id]["messages"].append(
-                MessageSchemaModel(
-                    message_id=message.id,
-                    sender=message.sender,
-                    content=message.content,
-                    created_at=message.created_at
-                )
-            )
 
         # Build the response model directly
         return GroupedChatResponseModel(
             user_id=user_id,
-            sessions=[
-                SessionSchemaModel(
-                    session_id=sid,
-                    session_name=data["session_name"],
-                    messages=data["messages"]
-                )
-                for sid, data in grouped_chats.items()
-            ]
+            sessions=list(self._group_by_session(result.all()))
         )
 
+    async def stream_chats_by_user_grouped(
+        self,
+        user_id: uuid.UUID,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Same sessions as ``get_chats_by_user_grouped`` as NDJSON, one session per
+        line. Rows come from a server-side cursor in batches of
+        CHAT_EXPORT_BATCH_SIZE and only the session being assembled is held in
+        memory.
+        """
+        query = self._grouped_chats_query(user_id, limit=limit, since=since, until=until)
+        try:
+            # The request-scoped session may be closed before the body is sent
+            read_session_maker = await replica_router.session_maker(user_id)
+            async with read_session_maker() as db_session:
+                result = await db_session.stream(
+                    query.execution_options(yield_per=settings.CHAT_EXPORT_BATCH_SIZE)
+                )
+                current = None
+                async for row in result:
+                    if current is not None and current.session_id != row.session_id:
+                        yield current.model_dump_json() + "\n"
+                        current = None
+                    if current is None:
+                        current = self._session_from_row(row)
+                    current.messages.append(self._message_from_row(row))
+                if current is not None:
+                    yield current.model_dump_json() + "\n"
+        except SQLAlchemyError as e:
+            print(f"[ChatAPI] Error streaming chats for user {user_id}: {e}")
+            yield json.dumps({"error": "Failed to read chat history"}) + "\n"
+
     
 
 # =================================================================================================================
@@ -237,7 +664,12 @@ class ChatAPIClient:
         Get all sessions for a user.
         """
 
-        stmt = select(ChatSession).where(ChatSession.user_id == user.id).order_by(ChatSession.created_at.desc())
+        # Range scan on ix_chat_sessions_user_id_last_message_at, most recent activity first
+        stmt = (
+            select(ChatSession)
+            .where(ChatSession.user_id == user.id, ChatSession.deleted_at.is_(None))
+            .order_by(ChatSession.last_message_at.desc())
+        )
         result = await session.execute(stmt)
         response = result.scalars().all()
 
@@ -250,42 +682,127 @@ class ChatAPIClient:
                     id=chat_session.id,
                     user_id=chat_session.user_id,
                     session_name=chat_session.session_name,
-                    created_at=chat_session.created_at
+                    created_at=chat_session.created_at,
+                    message_count=chat_session.message_count,
+                    last_message_at=chat_session.last_message_at,
+                    last_message_preview=chat_session.last_message_preview
                 )
                 for chat_session in response
             ]
         )
     
 
-    async def get_chat_by_session_id(self, session_id: str, session: AsyncSession) -> ChatSessionResponse:
+    @staticmethod
+    def _encode_cursor(message) -> str:
+        raw = f"{message.created_at.isoformat()}|{message.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidCursor()
+
+
+    async def get_chat_by_session_id(
+            self,
+            session_id: str,
+            session: AsyncSession,
+            limit: Optional[int] = None,
+            before: Optional[str] = None,
+            after: Optional[str] = None,
+        ) -> ChatSessionResponse:
         """
         Get chat history by session ID.
+
+        Without ``limit``/``before``/``after`` the whole history is returned. Otherwise
+        up to ``limit`` turns are returned (oldest first), newest turns by default,
+        older than ``before`` or newer than ``after``. Pages are keyset-paginated on
+        ``(created_at, id)`` and ``next_cursor`` continues in the same direction.
+        ``before`` and ``after`` are mutually exclusive.
         """
         if not session_id:
             raise InvalidSessionId()
+        if before is not None and after is not None:
+            raise InvalidCursor()
         
         session_id = uuid.UUID(session_id)
+        paginate = limit is not None or before is not None or after is not None
 
-        stmt = (
-            select(ChatMessageDB)
-            .where(ChatMessageDB.session_id == session_id)
-            .order_by(ChatMessageDB.created_at.asc())
-        )
-        result = await session.execute(stmt)
-
-        messages = result.scalars().all()
+        # Messages of a deleted session stay in the table until they are purged
+        chat_session = await self._get_session_ref(session_id, session)
+        if chat_session is None:
+            raise NoChatHistoryFoundError()
 
-        print("Messages:", messages)
-        if not messages:
+        stmt = select(ChatMessageDB).where(ChatMessageDB.session_id == session_id)
+        next_cursor = None
+
+        if not paginate:
+            stmt = stmt.order_by(ChatMessageDB.created_at.asc(), ChatMessageDB.id.asc())
+            messages = (await session.execute(stmt)).scalars().all()
+        else:
+            page_size = (limit or 20) * 2
+            key = tuple_(ChatMessageDB.created_at, ChatMessageDB.id)
+            forward = after is not None
+
+            if before is not None:
+                stmt = stmt.where(key < tuple_(*self._decode_cursor(before)))
+            elif forward:
+                stmt = stmt.where(key > tuple_(*self._decode_cursor(after)))
+
+            if forward:
+                stmt = stmt.order_by(ChatMessageDB.created_at.asc(), ChatMessageDB.id.asc())
+            else:
+                stmt = stmt.order_by(ChatMessageDB.created_at.desc(), ChatMessageDB.id.desc())
+
+            messages = list((await session.execute(stmt.limit(page_size + 1))).scalars().all())
+            has_more = len(messages) > page_size
+            messages = messages[:page_size]
+            if not forward:
+                messages.reverse()
+
+            # Keep turns whole: a reply whose question is on the next page (or a
+            # question whose reply is) is left for that page.
+            if has_more and forward and messages[-1].sender == "user":
+                messages.pop()
+            elif has_more and not forward and messages[0].sender == "ai":
+                messages.pop(0)
+
+            if has_more:
+                next_cursor = self._encode_cursor(messages[-1] if forward else messages[0])
+
+        # Older messages may have been moved to the cold archive; bring them
+        # back once the reader reaches the oldest end of what is still hot
+        reached_start = not paginate or (not forward and next_cursor is None)
+        if reached_start and await message_archive.pending(session_id, session):
+            try:
+                restored = await message_archive.restore_session(session_id)
+            except Exception as e:
+                # A missing or unreadable archive must not hide the live history
+                print(f"[ChatAPI] Failed to restore archived messages for session {session_id}: {e}")
+                restored = 0
+            if restored:
+                replica_router.mark_write(session_id)
+                async with async_session_maker() as primary:
+                    return await self.get_chat_by_session_id(str(session_id), primary, limit, before, after)
+
+        if not messages and not (before or after):
             raise NoChatHistoryFoundError()
 
-        # Get session name (if available)
-        session_stmt = select(ChatSession).where(ChatSession.id == session_id)
-        session_result = await session.execute(session_stmt)
-        session_obj = session_result.scalar_one_or_none()
-        session_name = session_obj.session_name if session_obj else "Unknown"
+        return {
+            "session_id": str(session_id),
+            "session_name": chat_session.session_name or "Unknown",
+            "chat_history": self._pair_turns(messages),
+            "next_cursor": next_cursor,
+        }
+
 
-        # Pair user and assistant messages
+    @staticmethod
+    def _pair_turns(messages) -> List[Dict[str, Any]]:
+        """Pair user and assistant messages into turns."""
         turns = []
         queue = deque()
 
@@ -301,14 +818,111 @@ class ChatAPIClient:
         while queue:
             turns.append(queue.popleft())
 
-        return {
-            "session_id": str(session_id),
-            "session_name": session_name,
-            "chat_history": turns
-        }
+        return turns
 
 
-    async def delete_session(self, session_id: str, session: AsyncSession) -> ChatGeneralResponse:
+    @staticmethod
+    async def mark_sessions_deleted(
+        session: AsyncSession,
+        *criteria,
+        detach_user: bool = False,
+    ) -> List[uuid.UUID]:
+        """
+        Mark the live sessions matching ``criteria`` deleted with a single UPDATE
+        and return their ids. ``detach_user`` also clears ``user_id`` so the owning
+        user row can be deleted before the purge has run. The caller commits.
+        """
+        values = {"deleted_at": datetime.utcnow()}
+        if detach_user:
+            values["user_id"] = None
+        result = await session.execute(
+            update(ChatSession)
+            .where(ChatSession.deleted_at.is_(None), *criteria)
+            .values(**values)
+            .returning(ChatSession.id)
+        )
+        return list(result.scalars().all())
+
+
+    async def _delete_sessions(self, session: AsyncSession, *criteria) -> tuple:
+        """
+        Delete the sessions matching ``criteria`` without loading them.
+
+        The sessions are marked deleted first. If they hold at most
+        CHAT_PURGE_INLINE_MAX_MESSAGES messages and have nothing archived they are
+        removed right away with one DELETE (messages go through ON DELETE CASCADE).
+        Otherwise they are left for ``purge_deleted_sessions``. Returns
+        ``(session_ids, deferred)``.
+        """
+        session_ids = await self.mark_sessions_deleted(session, *criteria)
+        if not session_ids:
+            return session_ids, False
+
+        marked = and_(ChatSession.deleted_at.is_not(None), *criteria)
+        inline_max = settings.CHAT_PURGE_INLINE_MAX_MESSAGES
+        # Counting stops at the threshold, so this stays cheap for huge histories
+        sample = (
+            select(ChatMessage.id)
+            .join(ChatSession, ChatSession.id == ChatMessage.session_id)
+            .where(marked)
+            .limit(inline_max + 1)
+            .subquery()
+        )
+        message_count = (await session.execute(select(func.count()).select_from(sample))).scalar()
+        if message_count > inline_max:
+            return session_ids, True
+        archived = await session.execute(
+            select(ChatMessageArchive.session_id)
+            .join(ChatSession, ChatSession.id == ChatMessageArchive.session_id)
+            .where(marked)
+            .limit(1)
+        )
+        if archived.first() is not None:
+            return session_ids, True
+
+        await session.execute(delete(ChatSession).where(marked))
+        return session_ids, False
+
+
+    async def purge_deleted_sessions(self, batch_size: Optional[int] = None) -> dict:
+        """
+        Remove sessions marked deleted, CHAT_PURGE_BATCH_SIZE rows per transaction:
+        their archived messages first, then their messages, then the now-empty
+        sessions. Safe to run from several workers at once.
+        """
+        batch_size = batch_size or settings.CHAT_PURGE_BATCH_SIZE
+        purged = {"archived": await message_archive.purge_deleted_sessions(), "messages": 0, "sessions": 0}
+        doomed_messages = (
+            select(ChatMessage.id)
+            .join(ChatSession, ChatSession.id == ChatMessage.session_id)
+            .where(ChatSession.deleted_at.is_not(None))
+            .limit(batch_size)
+        )
+        doomed_sessions = select(ChatSession.id).where(ChatSession.deleted_at.is_not(None)).limit(batch_size)
+
+        for key, stmt in (
+            ("messages", delete(ChatMessage).where(ChatMessage.id.in_(doomed_messages.scalar_subquery()))),
+            ("sessions", delete(ChatSession).where(ChatSession.id.in_(doomed_sessions.scalar_subquery()))),
+        ):
+            while True:
+                async with async_session_maker() as db_session:
+                    result = await db_session.execute(stmt.execution_options(synchronize_session=False))
+                    await db_session.commit()
+                purged[key] += result.rowcount
+                if result.rowcount < batch_size:
+                    break
+
+        if purged["messages"] or purged["sessions"]:
+            print(f"[ChatAPI] Purged {purged['sessions']} deleted sessions and {purged['messages']} messages")
+        return purged
+
+
+    async def delete_session(
+        self,
+        session_id: str,
+        session: AsyncSession,
+        background_tasks: Optional[BackgroundTasks] = None,
+    ) -> ChatGeneralResponse:
         """
         Delete a chat session by ID.
         """
@@ -318,14 +932,13 @@ class ChatAPIClient:
         
         session_id = uuid.UUID(session_id)
 
-        stmt = select(ChatSession).where(ChatSession.id == session_id)
-        result = await session.execute(stmt)
-        chat_session = result.scalars().first()
-        if not chat_session:
+        session_ids, deferred = await self._delete_sessions(session, ChatSession.id == session_id)
+        if not session_ids:
             raise NoChatSessionsFound()
-
-        await session.delete(chat_session)
         await session.commit()
+        self.forget_sessions(session_ids)
+        if deferred and background_tasks is not None:
+            background_tasks.add_task(self.purge_deleted_sessions)
             
         return ChatGeneralResponse(
             message="Session and its associated messages deleted successfully"
@@ -335,21 +948,18 @@ class ChatAPIClient:
     async def clear_all_user_chats(
         self,
         user: TokenUser,
-        session: AsyncSession
+        session: AsyncSession,
+        background_tasks: Optional[BackgroundTasks] = None,
     ) -> ChatGeneralResponse:
         """
         Clear all chat sessions for a user.
         """
-        stmt = select(ChatSession).where(ChatSession.user_id == user.id)
-        result = await session.execute(stmt)
-
-        if result is None:
-            raise NoChatSessionsFound()
-        
-        sessions = result.scalars().all()
-        for chat_session in sessions:
-            await session.delete(chat_session)
+        session_ids, deferred = await self._delete_sessions(session, ChatSession.user_id == user.id)
         await session.commit()
+        replica_router.mark_write(user.id)
+        self.forget_sessions(session_ids)
+        if deferred and background_tasks is not None:
+            background_tasks.add_task(self.purge_deleted_sessions)
 
         return ChatGeneralResponse(
             message="All chats cleared successfully"
@@ -360,6 +970,19 @@ class ChatAPIClient:
             
 
 
+    @staticmethod
+    def _check_upload_size(file: UploadFile):
+        """
+        Reject a file larger than the ceiling for its content type before forwarding it.
+        Backstop only: UploadSizeLimitMiddleware already stops such bodies while they stream.
+        """
+        limit = settings.UPLOAD_SIZE_LIMITS.get(file.content_type, settings.UPLOAD_MAX_BYTES)
+        if file.size is not None and file.size > limit:
+            raise FileTooLarge(
+                message=f"{file.content_type} uploads are limited to {limit // (1024 * 1024)} MB"
+            )
+
+
     async def proxy_chat_upload_service(
         self,
         session: AsyncSession,
@@ -371,27 +994,34 @@ class ChatAPIClient:
         clear_history: bool,
         token: str,
     ):
-        file_bytes = await file.read()
-
-        files = {
-            "file": (file.filename, file_bytes, file.content_type),
-            "message": (None, message),
-            "clear_history": (None, str(clear_history).lower()),
-            "session_id": (None, session_id or ""),
-            "document_id": (None, document_id or ""),
-        }
+        self._check_upload_size(file)
+
+        body = StreamingMultipart(
+            source=file,
+            filename=file.filename,
+            content_type=file.content_type,
+            size=file.size,
+            fields={
+                "message": message,
+                "clear_history": str(clear_history).lower(),
+                "session_id": session_id or "",
+                "document_id": document_id or "",
+            },
+        )
 
         headers = {
+            **body.headers,
             "Authorization": f"Bearer {token}",
             "accept": "application/json",
         }
 
         try:
-            response = await self.client.post(
+            response = await guards["upload"].call(lambda: self.client.post(
                 f"{self.base_url}/{endpoint}",
-                files=files,
-                headers=headers
-            )
+                content=body.stream(),
+                headers=headers,
+                timeout=upstream.timeout("upload")
+            ))
             response.raise_for_status()
             print(f"Chat upload response: {response.json()}")
             return response.json()
@@ -407,20 +1037,24 @@ class ChatAPIClient:
         file: UploadFile,
         token: str,
         ):
-        file_bytes = await file.read()
-        files = {
-            "file": (file.filename, file_bytes, file.content_type),
-        }
+        self._check_upload_size(file)
+
+        body = StreamingMultipart(
+            source=file,
+            filename=file.filename,
+            content_type=file.content_type,
+            size=file.size,
+        )
 
         try:
-            timeout = httpx.Timeout(10.0)
-            response = await self.client.post(
+            response = await guards["upload"].call(lambda: self.client.post(
                 f"{self.base_url}/{endpoint}",
-                files=files,
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=timeout
-            )
+                content=body.stream(),
+                headers={**body.headers, "Authorization": f"Bearer {token}"},
+                timeout=upstream.timeout("upload")
+            ))
             response.raise_for_status()
+            self.invalidate_rag_cache()
             return response.json()
         except httpx.HTTPStatusError as e:
             print("HTTP error:", e.response.status_code)
@@ -428,6 +1062,18 @@ class ChatAPIClient:
             raise FileUploadError()
 
 
+    @staticmethod
+    def _rag_cache_key(payload: dict) -> tuple:
+        query = " ".join(str(payload.get("query", "")).lower().split())
+        feature = payload.get("feature")
+        return (
+            query,
+            payload.get("top_k"),
+            payload.get("rerank_k"),
+            feature.strip().lower() if isinstance(feature, str) else feature,
+        )
+
+
     async def proxy_rag_query_service(
             self,
             session: AsyncSession, 
@@ -435,17 +1081,44 @@ class ChatAPIClient:
             payload: dict,
             token: str,
         ):
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/{endpoint}",
-                json=payload,
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Error in RAG query service: {e}")
-            raise RAGQueryError()
+        """
+        Forward a RAG query, serving repeated questions from the response cache.
+
+        Concurrent identical queries share one upstream call. Cached and shared
+        answers carry no upstream ``session_id``, so those callers start a fresh
+        chat session instead of reusing someone else's. If the shared call is
+        rejected for its caller's token, the others make their own call.
+        """
+        cache_key = self._rag_cache_key(payload)
+        cached = rag_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        async def fetch():
+            generation = rag_cache_generation
+            try:
+                response = await guards["rag"].call(lambda: self.client.post(
+                    f"{self.base_url}/{endpoint}",
+                    json=payload,
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=upstream.timeout("rag")
+                ), idempotent=True)
+                if response.status_code in (401, 403):
+                    raise InvalidToken()
+                response.raise_for_status()
+                result = response.json()
+            except (UpstreamUnavailable, InvalidToken):
+                raise
+            except Exception as e:
+                print(f"Error in RAG query service: {e}")
+                raise RAGQueryError()
+
+            if generation == rag_cache_generation:
+                rag_cache.set(cache_key, self._without_session(result))
+            return result
+
+        result, shared = await self.inflight.do((endpoint, cache_key), fetch, own_call_on=(InvalidToken,))
+        return self._without_session(result) if shared else result
 
 
     async def proxy_direct_query_service(
@@ -455,19 +1128,32 @@ class ChatAPIClient:
         payload: dict,
         user: str,
         ):
-        try:
-            response = await self.client.post(
-                f"{self.base_url}/{endpoint}",
-                json=payload, 
-                headers={"Authorization": f"Bearer {user.access_token}"}
-                )
-            response.raise_for_status()
-            result =  response.json()
+        """
+        Forward a direct query. Concurrent identical queries share one upstream
+        call; callers that joined it get the answer without the upstream session id,
+        or make their own call if the shared one was rejected for its token.
+        """
+        async def fetch():
+            try:
+                response = await guards["direct"].call(lambda: self.client.post(
+                    f"{self.base_url}/{endpoint}",
+                    json=payload,
+                    headers={"Authorization": f"Bearer {user.access_token}"},
+                    timeout=upstream.timeout("chat")
+                    ))
+                if response.status_code in (401, 403):
+                    raise InvalidToken()
+                response.raise_for_status()
+                return response.json()
+            except (UpstreamUnavailable, InvalidToken):
+                raise
+            except Exception as e:
+                print(f"Error in Direct query service: {e}")
+                raise DirectQueryError()
 
-            return result
-        except Exception as e:
-            print(f"Error in Direct query service: {e}")
-            raise DirectQueryError()
+        key = (endpoint, " ".join(str(payload.get("query", "")).lower().split()))
+        result, shared = await self.inflight.do(key, fetch, own_call_on=(InvalidToken,))
+        return self._without_session(result) if shared else result
         
 
     async def get_or_create_chat_session(
@@ -475,16 +1161,23 @@ class ChatAPIClient:
             session: AsyncSession,
             user_id: uuid.UUID,
             external_session_id: Optional[str] = None
-        ) -> ChatSession:
+        ) -> Union[ChatSession, SessionRef]:
             """
                 Retrieves a chat session by external_session_id or creates a new one.
             """
             if external_session_id:
+                ref = session_refs.get(("external", external_session_id))
+                if ref is not None:
+                    return ref
                 result = await session.execute(
-                    select(ChatSession).where(ChatSession.external_session_id == external_session_id)
+                    select(ChatSession).where(
+                        ChatSession.external_session_id == external_session_id,
+                        ChatSession.deleted_at.is_(None),
+                    )
                 )
                 chat_session = result.scalar_one_or_none()
                 if chat_session:
+                    self._remember_session(chat_session)
                     return chat_session
                 # else:
                 #     raise NoChatSessionsFound()
@@ -496,21 +1189,31 @@ class ChatAPIClient:
             )
             session.add(chat_session)
             await session.flush()
+            self._remember_session(chat_session)
             return chat_session
 
         
     async def list_features_service(
         self,
-        session: AsyncSession,
         endpoint: str,
         token: str,
     ):
-        try:
-            response = await self.client.get(
-                f"{self.base_url}/{endpoint}",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            raise ChatAPIError()
+        """
+        Return the upstream feature list from the in-process cache, refreshing it
+        in the background once it is older than FEATURES_CACHE_TTL.
+        """
+        async def fetch():
+            try:
+                response = await guards["features"].call(lambda: self.client.get(
+                    f"{self.base_url}/{endpoint}",
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=upstream.timeout("features")
+                ), idempotent=True)
+                response.raise_for_status()
+                return response.json()
+            except UpstreamUnavailable:
+                raise
+            except Exception as e:
+                raise ChatAPIError()
+
+        return await self.features_cache.get(fetch)
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Type
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the call as a task; callers arriving while
+    it is still running await the same task. Each waiter is shielded, so a
+    cancelled caller does not cancel the shared call for everyone else. Nothing
+    is kept once the call finishes, so results are never served stale.
+
+    Errors listed in ``own_call_on`` belong to the caller that started the call
+    (a rejected token, say); joiners that see one run their own ``func`` instead.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    async def do(
+            self,
+            key: Hashable,
+            func: Callable[[], Awaitable[Any]],
+            own_call_on: Tuple[Type[BaseException], ...] = (),
+        ) -> Tuple[Any, bool]:
+        """Run ``func`` once per in-flight ``key``. Returns ``(result, shared)``."""
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if shared:
+            self.coalesced += 1
+        else:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        if not shared or not own_call_on:
+            return await asyncio.shield(task), shared
+        try:
+            return await asyncio.shield(task), True
+        except own_call_on:
+            self.fallbacks += 1
+            return await func(), False
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "fallbacks": self.fallbacks,
+        }
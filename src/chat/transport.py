@@ -0,0 +1,169 @@
+import logging
+import importlib.util
+import secrets
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from src.config import settings
+
+
+logger = logging.getLogger("govllminer.transport")
+
+
+class UpstreamTransport:
+    """
+    Shared HTTP client for the bizllminer upstream.
+
+    A single connection pool is reused by every caller so keep-alive connections
+    (and HTTP/2 streams, when enabled) are shared instead of re-doing the TCP and
+    TLS handshake per request. The FastAPI lifespan starts and closes it.
+    """
+
+    def __init__(self):
+        self.base_url = settings.UPSTREAM_BASE_URL.rstrip("/")
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests_sent = 0
+        self.responses_by_status: dict[str, int] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the pooled client, creating it lazily outside of the app lifespan."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.UPSTREAM_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("UPSTREAM_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=http2,
+            timeout=self.timeout("chat"),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    async def start(self):
+        self.client
+        logger.info("Upstream transport started for %s", self.base_url)
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        logger.info("Upstream transport closed")
+
+    def timeout(self, kind: str) -> httpx.Timeout:
+        """Build the timeout for an endpoint family: chat, rag, upload or features."""
+        connect, read = settings.UPSTREAM_TIMEOUTS.get(kind, settings.UPSTREAM_TIMEOUTS["chat"])
+        return httpx.Timeout(connect=connect, read=read, write=read, pool=settings.UPSTREAM_POOL_TIMEOUT)
+
+    async def _on_request(self, request: httpx.Request):
+        self.requests_sent += 1
+
+    async def _on_response(self, response: httpx.Response):
+        key = f"{response.status_code // 100}xx"
+        self.responses_by_status[key] = self.responses_by_status.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        """Connection pool statistics for the health endpoint."""
+        stats = {
+            "base_url": self.base_url,
+            "started": self._client is not None and not self._client.is_closed,
+            "max_connections": settings.UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            "requests_sent": self.requests_sent,
+            "responses_by_status": dict(self.responses_by_status),
+        }
+        if not stats["started"]:
+            return stats
+
+        # httpx does not expose pool state publicly, so read it from httpcore defensively.
+        pool = getattr(self._client._transport, "_pool", None)
+        if pool is None:
+            return stats
+        connections = list(getattr(pool, "connections", []))
+        stats.update({
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "active_connections": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "http2_connections": sum(1 for c in connections if "HTTP/2" in c.info()),
+            "queued_requests": sum(
+                1 for r in getattr(pool, "_requests", []) if getattr(r, "connection", None) is None
+            ),
+        })
+        return stats
+
+
+class StreamingMultipart:
+    """
+    A multipart/form-data body that streams one file from an async source in
+    fixed-size chunks, so memory per upload stays bounded by ``chunk_size``.
+
+    ``source`` is anything with async ``read(n)`` and ``seek(offset)``, such as a
+    FastAPI ``UploadFile`` or an ``aiofiles`` handle. Every call to ``stream()``
+    rewinds the source, which lets a failed request be retried.
+    """
+
+    def __init__(
+        self,
+        source: Any,
+        filename: str,
+        content_type: Optional[str] = None,
+        file_field: str = "file",
+        fields: Optional[Dict[str, str]] = None,
+        size: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+    ):
+        self.source = source
+        self.size = size
+        self.chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        self.boundary = secrets.token_hex(16)
+
+        preamble = b"".join(
+            self._part_header(name) + str(value).encode() + b"\r\n"
+            for name, value in (fields or {}).items()
+        )
+        self._head = preamble + self._part_header(file_field, filename, content_type or "application/octet-stream")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    def _part_header(self, name: str, filename: Optional[str] = None, content_type: Optional[str] = None) -> bytes:
+        disposition = f'form-data; name="{self._quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{self._quote(filename)}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode()
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return value.replace("\r", "").replace("\n", "").replace('"', "%22")
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": f"multipart/form-data; boundary={self.boundary}"}
+        if self.size is not None:
+            headers["Content-Length"] = str(len(self._head) + self.size + len(self._tail))
+        return headers
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        await self.source.seek(0)
+        yield self._head
+        while True:
+            chunk = await self.source.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        yield self._tail
+
+
+upstream = UpstreamTransport()
@@ -6,6 +6,9 @@ class UploadResult(BaseModel):
     filename: Optional[str] = None
     status: str
     message: Optional[str] = None
+    attempts: int = 1
+    elapsed_ms: Optional[float] = None
+    response: Optional[Any] = None
 
 class UploadResponse(BaseModel):
     status: str
@@ -1,52 +1,130 @@
 # folder_ingestion.py
 from .utils import delete_folder
 from src.db.models import FolderUpload
-from src.errors import FolderIngestionError, FileUploadError
+from src.errors import FolderIngestionError, FileUploadError, UpstreamUnavailable
 from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
-from fastapi import HTTPException
-from .schemas import UploadResponse
+from fastapi import HTTPException, UploadFile
+import aiofiles
+from .schemas import UploadResponse, UploadResult
+from src.chat.transport import upstream, StreamingMultipart
+from src.chat.service import ChatAPIClient
+from src.chat.resilience import guards
+from src.config import settings
 from src.users.schemas import TokenUser
 import os
 import tempfile
 import uuid
 import shutil
+import time
+import asyncio
 from typing import List
 
 
+# Ingest is not idempotent: a 500 may have been stored upstream, so it is not retried
+RETRYABLE_STATUS_CODES = {408, 429, 502, 503, 504}
+
 
 class FolderIngestion:
     def __init__(self):
-        self.base_url = "https://bizllminer.equalyz.ai"
-        self.client = httpx.AsyncClient()
+        self.base_url = upstream.base_url
 
-    async def upload_file_to_api(self, endpoint, file_content: bytes, file_path: str, token: str):
-        headers = {"Authorization": f"Bearer {token}"}
-        url = f"{self.base_url}/{endpoint}"
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return upstream.client
 
-        try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    url,
-                    files={"file": (os.path.basename(file_path), file_content)},
-                    headers=headers
-                )
-            if response.status_code != 200:
-                print(f"Upload failed: {response.status_code} - {response.text}")
-                raise FileUploadError()
+    async def _post_multipart(self, endpoint, body: StreamingMultipart, token: str) -> httpx.Response:
+        return await guards["upload"].call(lambda: self.client.post(
+            f"{self.base_url}/{endpoint}",
+            content=body.stream(),
+            headers={**body.headers, "Authorization": f"Bearer {token}"},
+            timeout=upstream.timeout("upload")
+        ))
+
+
+    async def upload_file_with_retries(self, endpoint, body: StreamingMultipart, filename: str, token: str) -> UploadResult:
+        """
+        Stream one file to the upstream, retrying transport errors and retryable
+        upstream statuses with exponential backoff. Never raises: the outcome is
+        reported in the result.
+        """
+        started = time.perf_counter()
+        attempts = 0
+        message = None
+
+        while attempts <= settings.UPLOAD_MAX_RETRIES:
+            attempts += 1
+            try:
+                response = await self._post_multipart(endpoint, body, token)
+                if response.status_code == 200:
+                    return UploadResult(
+                        filename=filename,
+                        status="success",
+                        message="File uploaded and processed",
+                        attempts=attempts,
+                        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+                        response=response.json(),
+                    )
+                message = f"Upstream returned {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+            except httpx.TransportError as e:
+                message = f"Transport error: {e}"
+            except UpstreamUnavailable as e:
+                message = e.message
+
+            print(f"Upload of {filename} failed on attempt {attempts}: {message}")
+            if attempts <= settings.UPLOAD_MAX_RETRIES:
+                await asyncio.sleep(settings.UPLOAD_RETRY_BACKOFF * 2 ** (attempts - 1))
+
+        return UploadResult(
+            filename=filename,
+            status="failed",
+            message=message,
+            attempts=attempts,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+
+
+    async def _upload_streamed(self, endpoint, file: UploadFile, token: str) -> UploadResult:
+        """Forward the spooled UploadFile directly into the upstream request body."""
+        filename = os.path.basename(file.filename)
+        body = StreamingMultipart(
+            source=file,
+            filename=filename,
+            content_type=file.content_type,
+            size=file.size,
+        )
+        return await self.upload_file_with_retries(endpoint, body, filename, token)
+
+
+    async def _upload_from_disk(self, endpoint, file: UploadFile, temp_dir: str, token: str) -> UploadResult:
+        """Copy the upload to the temp directory in chunks, then stream it from disk."""
+        filename = os.path.basename(file.filename)
+        # Files from different subfolders can share a basename, so each gets its
+        # own path; ``filename`` only names the multipart part
+        file_path = os.path.join(temp_dir, f"{uuid.uuid4()}_{filename}")
+
+        async with aiofiles.open(file_path, "wb") as f:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
+
+        async with aiofiles.open(file_path, "rb") as f:
+            body = StreamingMultipart(
+                source=f,
+                filename=filename,
+                content_type=file.content_type,
+                size=os.path.getsize(file_path),
+            )
+            return await self.upload_file_with_retries(endpoint, body, filename, token)
 
-            return response.json()  
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error: {e}")
-            raise FileUploadError()
-    
 
     async def upload_files(self, endpoint, files: list, file_type: str, user: TokenUser) -> UploadResponse:
-        base_tmp = tempfile.gettempdir()
-        temp_dir = os.path.join(base_tmp, "uploads", str(uuid.uuid4()))
-        os.makedirs(temp_dir, exist_ok=True)
+        temp_dir = None
+        if settings.UPLOAD_SPOOL_TO_DISK:
+            temp_dir = os.path.join(tempfile.gettempdir(), "uploads", str(uuid.uuid4()))
+            os.makedirs(temp_dir, exist_ok=True)
 
-        valid_files = []
         try:
             invalid_files = [
                 file.filename for file in files
@@ -56,30 +134,45 @@ class FolderIngestion:
                 print(f"Invalid files: {invalid_files}")
                 raise FileUploadError()
 
-            # Save files
-            for file in files:
-                file_path = os.path.join(temp_dir, file.filename)
-                with open(file_path, "wb") as f:
-                    f.write(await file.read())
-                valid_files.append(file_path)
-
-            # Upload to external API
-            upload_results = []
-            for file_path in valid_files:
-                with open(file_path, "rb") as f:
-                    file_content = f.read()
-                    upload_result = await self.upload_file_to_api(endpoint, file_content, file_path, user.access_token)
-                    upload_results.append(upload_result)
-
-            return UploadResponse(
-                status="success",
-                message="Files uploaded and processed",
-                upload_results=upload_results,
-            )
+            # Upload to external API, at most UPLOAD_CONCURRENCY files at a time
+            semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+            async def bounded_upload(file: UploadFile) -> UploadResult:
+                async with semaphore:
+                    if temp_dir:
+                        return await self._upload_from_disk(endpoint, file, temp_dir, user.access_token)
+                    return await self._upload_streamed(endpoint, file, user.access_token)
+
+            upload_results = await asyncio.gather(*(bounded_upload(file) for file in files))
+            if any(result.status == "success" for result in upload_results):
+                ChatAPIClient.invalidate_rag_cache()
+            return self._build_response(upload_results)
         
         except HTTPException as e:
             print(e)
             raise FileUploadError()
         
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+    @staticmethod
+    def _build_response(upload_results: List[UploadResult]) -> UploadResponse:
+        succeeded = sum(1 for result in upload_results if result.status == "success")
+        failed = len(upload_results) - succeeded
+
+        if not succeeded:
+            print(f"No files could be uploaded: {[result.message for result in upload_results]}")
+            raise FileUploadError()
+
+        if not failed:
+            status, message = "success", "Files uploaded and processed"
+        else:
+            status, message = "partial", f"{succeeded} file(s) uploaded, {failed} failed"
+
+        return UploadResponse(
+            status=status,
+            message=message,
+            upload_results=upload_results,
+        )
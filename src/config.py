@@ -1,4 +1,5 @@
 import os
+from typing import Dict, List, Optional, Tuple
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from dotenv import load_dotenv
@@ -19,6 +20,145 @@ class Settings(BaseSettings):
     SESSION_SECRET_KEY: str
     RESEND_API_KEY: str
 
+    # Database engine
+    DATABASE_URL: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 10.0
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # "session", "transaction" (PgBouncer transaction pooling: no prepared
+    # statement reuse across transactions) or "auto" (transaction for *-pooler hosts)
+    DB_POOLER_MODE: str = "auto"
+
+    # Optional read replica for history/listing endpoints
+    READ_DATABASE_URL: Optional[str] = None
+    DB_REPLICA_MAX_LAG: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL: float = 5.0
+    # Reads touching a user or session written this recently go to the primary
+    DB_READ_YOUR_WRITES_WINDOW: float = 10.0
+
+    # Upstream (bizllminer) HTTP transport
+    UPSTREAM_BASE_URL: str = "https://bizllminer.equalyz.ai"
+    UPSTREAM_MAX_CONNECTIONS: int = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_POOL_TIMEOUT: float = 5.0
+    # (connect, read) timeouts in seconds per upstream endpoint family
+    UPSTREAM_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+        "chat": (5.0, 120.0),
+        "rag": (5.0, 60.0),
+        "upload": (5.0, 120.0),
+        "features": (3.0, 10.0),
+    }
+
+    # Upstream resilience: per-endpoint circuit breaker, retries and AIMD concurrency
+    UPSTREAM_BREAKER_FAILURE_THRESHOLD: int = 5
+    UPSTREAM_BREAKER_RESET_TIMEOUT: float = 30.0
+    UPSTREAM_RETRY_ATTEMPTS: int = 2
+    UPSTREAM_RETRY_BACKOFF: float = 0.2
+    UPSTREAM_CONCURRENCY_MIN: int = 2
+    UPSTREAM_CONCURRENCY_MAX: int = 64
+    # Latency (seconds) above which an endpoint's concurrency limit shrinks
+    UPSTREAM_LATENCY_TARGETS: Dict[str, float] = {
+        "chat": 30.0,
+        "upload": 30.0,
+        "rag": 15.0,
+        "direct": 30.0,
+        "features": 2.0,
+    }
+    # Hedged requests for idempotent reads (features, query/rag)
+    UPSTREAM_HEDGING: bool = False
+    UPSTREAM_HEDGE_PERCENTILE: float = 0.95
+    UPSTREAM_HEDGE_BUDGET: float = 0.05
+    UPSTREAM_HEDGE_MIN_SAMPLES: int = 20
+
+    # bcrypt runs on its own thread pool (defaults to min(4, CPUs) workers);
+    # requests beyond workers + queue are rejected with 503
+    PASSWORD_HASH_WORKERS: Optional[int] = None
+    PASSWORD_HASH_QUEUE_MAX: int = 64
+
+    # Single-use email verification and password reset tokens (seconds)
+    AUTH_TOKEN_VERIFY_EMAIL_TTL: int = 48 * 3600
+    AUTH_TOKEN_RESET_PASSWORD_TTL: int = 3600
+    AUTH_TOKEN_PURGE_INTERVAL: float = 3600.0
+    AUTH_TOKEN_PURGE_BATCH_SIZE: int = 5000
+
+    # Transactional email outbox: providers are tried in order ("resend",
+    # "brevo", or "fake" to keep mail in memory locally)
+    EMAIL_PROVIDERS: List[str] = ["resend", "brevo"]
+    EMAIL_OUTBOX_INTERVAL: float = 2.0
+    EMAIL_OUTBOX_BATCH_SIZE: int = 20
+    EMAIL_MAX_ATTEMPTS: int = 8
+    EMAIL_RETRY_BACKOFF: float = 30.0
+    # Per provider call; a claimed email is leased for this long per provider
+    # (plus a margin) before another worker may pick it up again
+    EMAIL_SEND_TIMEOUT: float = 15.0
+    # Sent and dead emails are deleted after this long
+    EMAIL_OUTBOX_RETENTION: float = 7 * 24 * 3600.0
+    EMAIL_OUTBOX_PURGE_INTERVAL: float = 3600.0
+    EMAIL_OUTBOX_PURGE_BATCH_SIZE: int = 5000
+    EMAIL_BREAKER_FAILURE_THRESHOLD: int = 5
+    EMAIL_BREAKER_RESET_TIMEOUT: float = 60.0
+
+    # Folder ingestion fan-out
+    UPLOAD_CONCURRENCY: int = 5
+    UPLOAD_MAX_RETRIES: int = 2
+    UPLOAD_RETRY_BACKOFF: float = 0.5
+    UPLOAD_CHUNK_SIZE: int = 64 * 1024
+    # Copy uploads to a temp directory before forwarding instead of streaming them
+    UPLOAD_SPOOL_TO_DISK: bool = False
+    # Single-file chat uploads: overall request ceiling and per content-type ceilings in bytes
+    UPLOAD_MAX_BYTES: int = 300 * 1024 * 1024
+    UPLOAD_SIZE_LIMITS: Dict[str, int] = {
+        "application/pdf": 50 * 1024 * 1024,
+        "image/jpeg": 20 * 1024 * 1024,
+        "image/png": 20 * 1024 * 1024,
+        "audio/mpeg": 100 * 1024 * 1024,
+        "audio/wav": 300 * 1024 * 1024,
+    }
+
+    # RAG response cache (cleared whenever new documents are ingested)
+    RAG_CACHE_MAXSIZE: int = 1024
+    RAG_CACHE_TTL: float = 600.0
+
+    # /chat/list_features: refreshed in the background once older than the TTL
+    FEATURES_CACHE_TTL: float = 300.0
+
+    # ChatSession.id <-> external_session_id mappings (immutable, LRU-bounded)
+    SESSION_CACHE_MAXSIZE: int = 10000
+
+    # Verified access tokens, each kept until its exp
+    TOKEN_CACHE_MAXSIZE: int = 10000
+
+    # Users by normalized email for sign-in and the auth emails; unknown emails
+    # are remembered for the shorter negative TTL
+    USER_CACHE_MAXSIZE: int = 10000
+    USER_CACHE_TTL: float = 60.0
+    USER_CACHE_NEGATIVE_TTL: float = 10.0
+
+    # Rows fetched per round trip when streaming GET /chat/{user_id}/chats
+    CHAT_EXPORT_BATCH_SIZE: int = 500
+
+    # Deleted sessions with more messages than this are purged in the background
+    CHAT_PURGE_INLINE_MAX_MESSAGES: int = 5000
+    CHAT_PURGE_BATCH_SIZE: int = 5000
+    CHAT_PURGE_INTERVAL: float = 300.0
+
+    # chat_messages monthly partitions and cold archive
+    CHAT_PARTITION_MONTHS_AHEAD: int = 3
+    CHAT_PARTITION_CHECK_INTERVAL: float = 6 * 3600.0
+    # Archiving removes rows from the database; only enable it with a durable CHAT_ARCHIVE_DIR
+    CHAT_ARCHIVE_ENABLED: bool = False
+    CHAT_ARCHIVE_AFTER_MONTHS: int = 12
+    CHAT_ARCHIVE_DIR: str = "archive/chat_messages"
+    # "ndjson" (gzip) or "parquet" (needs pyarrow)
+    CHAT_ARCHIVE_FORMAT: str = "ndjson"
+    CHAT_ARCHIVE_INTERVAL: float = 24 * 3600.0
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
@@ -8,10 +8,26 @@ from sqlmodel import Field, SQLModel, Column, Relationship
 from sqlalchemy import Enum
 from enum import Enum as PyEnum
 from sqlalchemy.dialects.postgresql import ENUM
-from sqlalchemy import ForeignKey
+from sqlalchemy import BigInteger, ForeignKey, Index, Integer, text
 
 class ChatSession(SQLModel, table=True):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        Index("ix_chat_sessions_user_id_created_at", "user_id", "created_at"),
+        Index(
+            "ix_chat_sessions_external_session_id", "external_session_id",
+            postgresql_where=text("external_session_id IS NOT NULL"),
+        ),
+        Index(
+            "ix_chat_sessions_deleted_at", "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+        # Sidebar: live sessions of a user by last activity
+        Index(
+            "ix_chat_sessions_user_id_last_message_at", "user_id", "last_message_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id : uuid.UUID = Field(
         sa_column=Column(
@@ -21,19 +37,32 @@ class ChatSession(SQLModel, table=True):
             default=uuid.uuid4
         )
     )
-    user_id: Optional[uuid.UUID] = Field(default=None, foreign_key="users.id")
+    user_id: Optional[uuid.UUID] = Field(default=None, foreign_key="users.id", ondelete="SET NULL")
     user: Optional["User"] = Relationship(back_populates="chat_sessions")
     session_name: str = Field(nullable=True, default=None)
 
     external_session_id: Optional[str] = Field(default=None)
     created_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
     updated_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow))
+    # Activity summary, kept current by save_full_chat_session
+    message_count: int = Field(default=0, sa_column=Column(Integer, nullable=False, default=0, server_default="0"))
+    last_message_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
+    last_message_preview: Optional[str] = Field(default=None)
+    # Set when the session is deleted; the rows are purged later in batches
+    deleted_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, nullable=True))
 
-    messages: List["ChatMessage"] = Relationship(back_populates="session", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    # passive_deletes: leave the messages to ON DELETE CASCADE instead of loading them
+    messages: List["ChatMessage"] = Relationship(back_populates="session", sa_relationship_kwargs={"cascade": "all, delete-orphan", "passive_deletes": True})
 
 
 class ChatMessage(SQLModel, table=True):
     __tablename__ = "chat_messages"
+    # Range-partitioned by month on created_at (see src/db/partitions.py), so
+    # created_at is part of the primary key
+    __table_args__ = (
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id : uuid.UUID = Field(
         sa_column=Column(
@@ -56,7 +85,22 @@ class ChatMessage(SQLModel, table=True):
     sender: str = Field(nullable=False)  # "user" or "ai"
     content: str = Field(nullable=False)
 
-    created_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
+    created_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow, primary_key=True, nullable=False))
+
+
+class ChatMessageArchive(SQLModel, table=True):
+    """Where the messages of a session from one archived monthly partition were exported."""
+    __tablename__ = "chat_message_archives"
+
+    session_id: uuid.UUID = Field(sa_column=Column(pg.UUID, primary_key=True, nullable=False))
+    partition_name: str = Field(primary_key=True)
+    path: str
+    # Byte range of the session's own gzip member in an NDJSON archive
+    offset: Optional[int] = Field(default=None, sa_column=Column(BigInteger, nullable=True))
+    length: Optional[int] = Field(default=None, sa_column=Column(BigInteger, nullable=True))
+    message_count: int = Field(default=0)
+    archived_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
+    restored_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, nullable=True))
 
 
 
@@ -75,16 +119,68 @@ class User(SQLModel, table=True):
     password: str 
     full_name: Optional[str] = Field(default=None)
     is_verified: bool = Field(default=False)
-    verification_token: Optional[str] = Field(default=None)
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
     updated_at: datetime =  Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now, onupdate=datetime.utcnow))
 
-    chat_sessions: List[ChatSession] = Relationship(back_populates="user") 
+    chat_sessions: List[ChatSession] = Relationship(back_populates="user", passive_deletes=True) 
 
     def __repl__(self):
         return f"User {self.email}"
 
 
+class AuthToken(SQLModel, table=True):
+    """Single-use email verification or password reset token; only its SHA-256 is stored."""
+    __tablename__ = "auth_tokens"
+    __table_args__ = (
+        Index("ix_auth_tokens_user_id_purpose", "user_id", "purpose"),
+        Index("ix_auth_tokens_expires_at", "expires_at"),
+    )
+
+    token_hash: str = Field(primary_key=True)
+    purpose: str  # "verify_email" or "reset_password"
+    user_id: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID,
+            ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False
+        )
+    )
+    expires_at: datetime = Field(sa_column=Column(DateTime, nullable=False))
+    created_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
+
+
+class EmailOutbox(SQLModel, table=True):
+    """Transactional email queued with the change that triggered it and sent by the outbox worker."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index(
+            "ix_email_outbox_next_attempt_at", "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(
+        sa_column=Column(
+            pg.UUID,
+            nullable=False,
+            primary_key=True,
+            default=uuid.uuid4
+        )
+    )
+    kind: str  # "verification" or "reset_password"
+    to_email: str
+    subject: str
+    # Carries the raw token of the link, so it is cleared once the email is sent or dead
+    html: Optional[str] = Field(default=None)
+    status: str = Field(default="pending")  # "pending", "sent" or "dead"
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow, nullable=False))
+    last_error: Optional[str] = Field(default=None)
+    provider: Optional[str] = Field(default=None)
+    created_at: datetime = Field(sa_column=Column(DateTime, default=datetime.utcnow))
+    sent_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime, nullable=True))
+
+
 
 
 # ============================================Folder Models
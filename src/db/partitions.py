@@ -0,0 +1,111 @@
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.config import settings
+
+
+logger = logging.getLogger("govllminer.partitions")
+
+PARENT_TABLE = "chat_messages"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+_MONTHLY = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(moment: datetime) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """First day of the month a partition covers, or None for non-monthly tables."""
+    match = _MONTHLY.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    result = await conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": PARENT_TABLE},
+    )
+    return result.first() is not None
+
+
+async def attached_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = to_regclass(:table)"
+        ),
+        {"table": PARENT_TABLE},
+    )
+    return [row[0] for row in result]
+
+
+async def detached_partitions(conn: AsyncConnection) -> List[str]:
+    """Monthly tables that are no longer attached, e.g. left by an interrupted archive run."""
+    attached = set(await attached_partitions(conn))
+    result = await conn.execute(
+        text(
+            "SELECT relname FROM pg_class"
+            " WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND relname LIKE :pattern"
+        ),
+        {"pattern": f"{PARENT_TABLE}_p%"},
+    )
+    return sorted(
+        name for (name,) in result
+        if name not in attached and partition_month(name) is not None
+    )
+
+
+async def ensure_future_partitions(engine: AsyncEngine, months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Create the default partition and monthly partitions from the current month
+    to ``months_ahead`` months out. Idempotent; returns the partitions created.
+    Does nothing when chat_messages is not partitioned (e.g. before the migration).
+    """
+    months_ahead = settings.CHAT_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    created = []
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not await is_partitioned(conn):
+            return created
+
+        existing = set(await attached_partitions(conn))
+        if DEFAULT_PARTITION not in existing:
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+            ))
+            created.append(DEFAULT_PARTITION)
+
+        first = month_start(datetime.utcnow())
+        for offset in range(months_ahead + 1):
+            month = add_months(first, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            try:
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE}"
+                    f" FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                ))
+                created.append(name)
+            except Exception as e:
+                # Usually rows for this month already sit in the default partition
+                logger.warning("Could not create partition %s: %s", name, e)
+
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
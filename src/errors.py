@@ -74,6 +74,18 @@ class ChatAPIError(GovLLMiner):
         super().__init__(message=message, error_code="chat_api_error")
 
 
+class UpstreamUnavailable(ChatAPIError):
+    """Raised without calling the chat API when its circuit is open or it is saturated."""
+    def __init__(self, message: str = "Chat API temporarily unavailable"):
+        GovLLMiner.__init__(self, message=message, error_code="upstream_unavailable")
+
+
+class AuthBusy(GovLLMiner):
+    """Raised when the password hashing pool is saturated."""
+    def __init__(self, message: str = "Authentication temporarily unavailable"):
+        super().__init__(message=message, error_code="auth_busy")
+
+
 class ChatSessionSaveError(GovLLMiner):
     """Raised when saving a chat session or messages fails."""
     def __init__(self, message: str = "Failed to save chat session or messages"):
@@ -100,6 +112,12 @@ class ChatUploadError(GovLLMiner):
         super().__init__(message=message, error_code="chat_upload_error")
 
 
+class FileTooLarge(GovLLMiner):
+    """Raised when an uploaded file exceeds the size limit for its content type."""
+    def __init__(self, message: str = "File too large"):
+        super().__init__(message=message, error_code="file_too_large")
+
+
 
 # ============================================  RAG and Direct Query Errors
 class RAGQueryError(GovLLMiner):
@@ -150,6 +168,10 @@ class NoChatHistoryFoundError(GovLLMiner):
     """No chats history found"""
     pass
 
+class InvalidCursor(GovLLMiner):
+    """Pagination cursor is malformed"""
+    pass
+
 def create_exception_handler(
     status_code: int, initial_detail: Any
 ) -> Callable[[Request, Exception], JSONResponse]:
@@ -184,6 +206,17 @@ def register_all_errors(app: FastAPI):
         ),
     )
 
+    app.add_exception_handler(
+        FileTooLarge,
+        create_exception_handler(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            initial_detail={
+                "message": "File too large",
+                "error_code": "file_too_large",
+            },
+        ),
+    )
+
     app.add_exception_handler(
         FolderIngestionError,
         create_exception_handler(
@@ -327,6 +360,30 @@ def register_all_errors(app: FastAPI):
         ),  
         )
     
+    app.add_exception_handler(
+        UpstreamUnavailable,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "Chat API temporarily unavailable",
+                "resolution": "Please try again shortly",
+                "error_code": "upstream_unavailable",
+            },
+        ),
+    )
+    
+    app.add_exception_handler(
+        AuthBusy,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "Authentication temporarily unavailable",
+                "resolution": "Please try again shortly",
+                "error_code": "auth_busy",
+            },
+        ),
+    )
+
     app.add_exception_handler(
         ChatSessionSaveError,
         create_exception_handler(
@@ -383,6 +440,17 @@ def register_all_errors(app: FastAPI):
 
     )
 
+    app.add_exception_handler(
+        InvalidCursor,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "Invalid pagination cursor",
+                "error_code": "invalid_cursor",
+            },
+        )
+    )
+
     app.add_exception_handler(
         ChatUploadError,
         create_exception_handler(
@@ -4,11 +4,15 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import json, traceback
+from typing import Optional
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
 from starlette.responses import Response
 from colorlog import ColoredFormatter
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
 from sqlalchemy.exc import IntegrityError
+from src.config import settings
 
 
 allowed_origins = [
@@ -17,6 +21,14 @@ allowed_origins = [
     "https://accounts.google.com",
 ]
 
+# Single-file upload endpoints whose request body is capped by UPLOAD_MAX_BYTES
+size_limited_paths = (
+    "/chat/upload_file_with_chat",
+    "/chat/file/upload",
+)
+# Room for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
 
 # Formatter for console
 console_formatter = ColoredFormatter(
@@ -50,8 +62,162 @@ logger.addHandler(console_handler)
 logger.addHandler(file_handler)
 
 
+class _UploadTooLarge(Exception):
+    pass
+
+
+class _MultipartMeter:
+    """
+    Follows a multipart body as it streams in and measures each file part
+    against UPLOAD_SIZE_LIMITS for that part's own Content-Type (UPLOAD_MAX_BYTES
+    for other types). Stops metering if the body does not parse; the overall
+    cap still applies then.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.limit: Optional[int] = None
+        self.content_type = ""
+        self.part_bytes = 0
+        self.exceeded = False
+        self._headers: dict = {}
+        self._field = b""
+        self._value = b""
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+        })
+
+    @classmethod
+    def for_request(cls, headers: Headers) -> Optional["_MultipartMeter"]:
+        content_type, options = parse_options_header(headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+            return None
+        return cls(options[b"boundary"])
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse the next chunk of the body; True once a file part is over its ceiling."""
+        if self._parser is not None and chunk:
+            try:
+                self._parser.write(chunk)
+            except Exception:
+                self._parser = None
+        return self.exceeded
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self.limit = None
+        self.part_bytes = 0
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" in disposition:
+            # Same value Starlette puts on UploadFile.content_type
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+            self.limit = settings.UPLOAD_SIZE_LIMITS.get(self.content_type, settings.UPLOAD_MAX_BYTES)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self.limit is None:
+            return
+        self.part_bytes += end - start
+        if self.part_bytes > self.limit:
+            self.exceeded = True
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Caps the request body of the single-file upload endpoints. A declared
+    Content-Length over the overall cap is refused before anything is read.
+    Otherwise the body is followed as it is received: the file part is held to
+    the ceiling for its Content-Type and the whole body to the overall cap, and
+    the request is cut off at the first byte over either, so nothing oversized
+    is spooled whole. ``_check_upload_size`` in the chat service stays as a
+    backstop.
+    """
+
+    def __init__(self, app, max_bytes: int = None):
+        self.app = app
+        self.max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" \
+                or not scope["path"].endswith(size_limited_paths):
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            logger.warning(f"Rejected {content_length} byte upload at {scope['path']}")
+            return await self._reject(scope, receive, send)
+
+        meter = _MultipartMeter.for_request(headers)
+        received = 0
+        exceeded = None
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > self.max_bytes:
+                    exceeded = f"over {self.max_bytes} bytes"
+                elif meter is not None and meter.feed(chunk):
+                    exceeded = f"{meter.content_type or 'file'} over {meter.limit} bytes"
+                if exceeded:
+                    raise _UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Whatever the app answers to a truncated body is replaced by the 413
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            logger.warning(f"Rejected streamed upload {exceeded} at {scope['path']}")
+            message = "File too large"
+            if meter is not None and meter.exceeded:
+                message = f"{meter.content_type} uploads are limited to {meter.limit // (1024 * 1024)} MB"
+            await self._reject(scope, receive, send, message)
+
+    @staticmethod
+    async def _reject(scope, receive, send, message: str = "File too large"):
+        response = JSONResponse(
+            status_code=413,
+            content={"message": message, "error_code": "file_too_large"},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
+
+
 def register_middleware(app: FastAPI):
-    
+    # Added first so it runs inside the request logger, which then logs the 413
+    app.add_middleware(UploadSizeLimitMiddleware)
+
     # Middleware to handle exceptions
     @app.exception_handler(HTTPException)
     async def http_exception_handler(request: Request, exc: HTTPException):
@@ -129,7 +295,6 @@ def register_middleware(app: FastAPI):
         return response
 
 
-
     # CORS middleware
     app.add_middleware(
         CORSMiddleware,
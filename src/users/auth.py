@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Callable
 from itsdangerous import URLSafeTimedSerializer
@@ -6,7 +8,7 @@ from itsdangerous import URLSafeTimedSerializer
 import jwt
 from passlib.context import CryptContext
 from src.config import settings
-from src.errors import UserAlreadyExists, InvalidCredentials, AccountNotVerified, UserNotFound, NotAuthenticated
+from src.errors import UserAlreadyExists, InvalidCredentials, AccountNotVerified, UserNotFound, NotAuthenticated, RevokedToken
 from fastapi import Request, Response, HTTPException
 import secrets
 from fastapi.security import OAuth2PasswordBearer
@@ -18,11 +20,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from .schemas import LoginResponseReadModel, TokenUser, UserModel
 from typing import Optional
 from passlib.hash import bcrypt
+from .hashing import PasswordHasher
+from src.cache import ExpiringMap, TTLCache
 
 passwd_context = CryptContext(schemes=["bcrypt"])
+# Async handlers hash and verify through this pool, never on the event loop
+password_hasher = PasswordHasher(passwd_context)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
 
+# Verified identity per access token, keyed by sha256 of the token and kept
+# until the token's exp, so repeat requests skip jwt.decode
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_MAXSIZE)
+# Revocations are never evicted, only expired: dropping one early would make
+# the revoked tokens valid again
+# sha256 of a logged-out token -> True, until the token expires
+revoked_tokens = ExpiringMap()
+# user id -> when all of their tokens were revoked (account deleted)
+revoked_users = ExpiringMap()
+
 class OptionalOAuth2Scheme(OAuth2PasswordBearer):
     async def __call__(self, request: Request) -> Optional[str]:
         try:
@@ -34,17 +50,6 @@ class OptionalOAuth2Scheme(OAuth2PasswordBearer):
 optional_oauth2_scheme = OptionalOAuth2Scheme(tokenUrl="token")
 
 
-def generate_passwd_hash(password: str) -> str:
-    hash = passwd_context.hash(password)
-    return hash
-
-def verify_password(password: str, hash: str) -> bool:
-    return passwd_context.verify(password, hash)
-
-def get_password_hash(password: str):
-    return passwd_context.hash(password)
-
-
 def decode_token(token: str) -> dict:
     try:
         token_data = jwt.decode(
@@ -85,6 +90,7 @@ def create_access_token(user, expires_delta: timedelta | None = None):
             "id": str(user.id),
             "is_verified": user.is_verified,
             "full_name": user.full_name if user.full_name else None,
+            "iat": datetime.now(timezone.utc),
             "exp": datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
         }
         return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
@@ -93,6 +99,58 @@ def create_access_token(user, expires_delta: timedelta | None = None):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoke_token(token: str):
+    """Reject ``token`` in this process until it would have expired anyway."""
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    except jwt.PyJWTError:
+        return
+    key = _token_key(token)
+    revoked_tokens.set(key, True, ttl=max(0.0, payload["exp"] - time.time()))
+    token_cache.pop(key)
+
+
+def revoke_user_tokens(user_id):
+    """Reject every token issued to ``user_id`` up to now."""
+    revoked_users.set(str(user_id), time.time(), ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def _verify_access_token(access_token: str):
+    """Decode and verify a token; returns the identity and when it was issued."""
+    try:
+        payload = jwt.decode(access_token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    email = payload.get("sub")
+    user_id = payload.get("id")
+    full_name = payload.get("full_name") if payload.get("full_name") else None
+
+    if not email or not user_id:
+        raise HTTPException(status_code=401, detail="Token missing fields")
+
+    current_user = TokenUser(
+        full_name=full_name if full_name else None,
+        email=email,
+        id=user_id,
+        is_verified=payload.get("is_verified"),
+        access_token=access_token,
+        token_type="bearer"
+    )
+    token_cache.set(
+        _token_key(access_token),
+        (current_user, payload.get("iat", 0)),
+        ttl=max(0.0, payload["exp"] - time.time()) if "exp" in payload else None,
+    )
+    return current_user, payload.get("iat", 0)
+
+
 async def get_current_user(
     request: Request,
     token: Optional[str] = Depends(optional_oauth2_scheme),
@@ -103,28 +161,21 @@ async def get_current_user(
     if not access_token:
         raise NotAuthenticated()
 
-    try:
-        payload = jwt.decode(access_token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        email = payload.get("sub")
-        user_id = payload.get("id")
-        full_name = payload.get("full_name") if payload.get("full_name") else None
-
-        if not email or not user_id:
-            raise HTTPException(status_code=401, detail="Token missing fields")
-
-        return TokenUser(
-            full_name=full_name if full_name else None,
-            email=email,
-            id=user_id,
-            is_verified=payload.get("is_verified"),
-            access_token=access_token,
-            token_type="bearer"
-        )
+    # The identity comes from the token alone, never from the database
+    key = _token_key(access_token)
+    if revoked_tokens.get(key):
+        raise RevokedToken()
+    cached = token_cache.get(key)
+    current_user, issued_at = cached or _verify_access_token(access_token)
 
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    revoked_at = revoked_users.get(str(current_user.id))
+    if revoked_at is not None and issued_at <= revoked_at:
+        raise RevokedToken()
+
+    # Lets later dependencies (e.g. replica routing) see who is asking
+    request.state.user_id = str(current_user.id)
+
+    return current_user
 
 
 def verify_email_response(user, access_token: str, response):
@@ -1,25 +1,33 @@
-from __future__ import print_function
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import resend
 import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.chat.resilience import CircuitBreaker
 from src.config import settings
-from typing import Optional
-import resend
+from src.db.main import async_session_maker
+from src.db.models import EmailOutbox
+
 
+logger = logging.getLogger("govllminer.email")
 
-def send_verification_email(to_email: str, verification_token: str):
-    print("Sending verification email to: ", to_email)
-    print("The verification token is: ", verification_token)
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = settings.BREVO_API_KEY
+# Longest wait between two delivery attempts of the same email
+MAX_RETRY_DELAY = 3600.0
+# Time left after the provider calls of a claimed email to record the outcome
+LEASE_MARGIN = 30.0
 
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
 
-    verification_link = f"{settings.FRONTEND_URL}/auth/verify-email?token={verification_token}"
+# ---------------------------------------------------------------- templates
 
-    sender = {"name": "GovLLMiner", "email": settings.EMAIL_FROM}
-    to = [{"email": to_email}]
-    
-    subject = "Verify Your Email Address"
+def render_verification_email(verification_token: str) -> Tuple[str, str]:
+    verification_link = f"{settings.FRONTEND_URL}/verify-email?token={verification_token}"
+    subject = "GovLLMiner: Verify Your Email Address"
     html_content = f"""
         <html>
             <body>
@@ -30,33 +38,12 @@ def send_verification_email(to_email: str, verification_token: str):
             </body>
         </html>
     """
-
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-        sender=sender,
-        to=to,
-        subject=subject,
-        html_content=html_content
-    )
-
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(api_response)
-    except ApiException as e:
-        print(f"Exception when calling SMTPApi->send_transac_email: {e}\n")
+    return subject, html_content
 
 
-def send_reset_password_email(to_email: str, reset_token: str):
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = settings.BREVO_API_KEY
-
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-
-    reset_link = f"{settings.FRONTEND_URL}/auth/reset-password?token={reset_token}"
-
-    sender = {"name": "AIforGoV", "email": settings.EMAIL_FROM}
-    to = [{"email": to_email}]
-    
-    subject = "Reset Your Password"
+def render_reset_password_email(reset_token: str) -> Tuple[str, str]:
+    reset_link = f"{settings.FRONTEND_URL}/reset-password?token={reset_token}"
+    subject = "GovLLMiner: Reset Your Password"
     html_content = f"""
         <html>
             <body>
@@ -68,79 +55,239 @@ def send_reset_password_email(to_email: str, reset_token: str):
             </body>
         </html>
     """
+    return subject, html_content
 
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-        sender=sender,
-        to=to,
-        subject=subject,
-        html_content=html_content
-    )
 
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(api_response)
-    except ApiException as e:
-        print(f"Exception when calling SMTPApi->send_transac_email: {e}\n")
+# ---------------------------------------------------------------- outbox
 
+def queue_email(session: AsyncSession, kind: str, to_email: str, subject: str, html: str) -> EmailOutbox:
+    """
+    Add an email to the outbox on ``session``. It is only sent once the
+    caller commits, so it goes out if and only if the change that triggered it
+    is persisted.
+    """
+    email = EmailOutbox(kind=kind, to_email=to_email, subject=subject, html=html)
+    session.add(email)
+    return email
 
 
-resend.api_key = settings.RESEND_API_KEY
-def send_verification_email_resend(to_email: str, verification_token: str):
-    print("Sending verification email to: ", to_email)
-    print("The verification token is: ", verification_token)
+def queue_verification_email(session: AsyncSession, to_email: str, verification_token: str) -> EmailOutbox:
+    return queue_email(session, "verification", to_email, *render_verification_email(verification_token))
 
-    verification_link = f"{settings.FRONTEND_URL}/verify-email?token={verification_token}"
 
-    sender = "GovLLMiner <no-reply@equalyz.ai>"
-    subject = "GovLLMiner: Verify Your Email Address"
-    
-    html_content = f"""
-        <html>
-            <body>
-                <h2>Email Verification</h2>
-                <p>Click the link below to verify your email address:</p>
-                <a href="{verification_link}">Verify Email</a>
-                <p>If you did not request this, please ignore this email.</p>
-            </body>
-        </html>
-    """
-    try:
-        response = resend.Emails.send({
-            "from": sender,
+def queue_reset_password_email(session: AsyncSession, to_email: str, reset_token: str) -> EmailOutbox:
+    return queue_email(session, "reset_password", to_email, *render_reset_password_email(reset_token))
+
+
+# ---------------------------------------------------------------- providers
+
+class ResendProvider:
+    name = "resend"
+
+    def __init__(self):
+        resend.api_key = settings.RESEND_API_KEY
+
+    async def send(self, to_email: str, subject: str, html: str):
+        await asyncio.to_thread(resend.Emails.send, {
+            "from": "GovLLMiner <no-reply@equalyz.ai>",
             "to": to_email,
             "subject": subject,
-            "html": html_content
+            "html": html,
         })
-        print("Email sent successfully: ", response)
-    except Exception as e:
-        print(f"Exception when sending email: {e}\n")
 
 
+class BrevoProvider:
+    name = "brevo"
 
-def send_reset_password_email_resend(to_email: str, reset_token: str):
-    reset_link = f"{settings.FRONTEND_URL}/reset-password?token={reset_token}"
+    def __init__(self):
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = settings.BREVO_API_KEY
+        self.api = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
 
-    sender = "GovLLMiner <no-reply@equalyz.ai>"
-    subject = "GovLLMiner: Reset Your Password"
+    async def send(self, to_email: str, subject: str, html: str):
+        await asyncio.to_thread(self.api.send_transac_email, sib_api_v3_sdk.SendSmtpEmail(
+            sender={"name": "GovLLMiner", "email": settings.EMAIL_FROM},
+            to=[{"email": to_email}],
+            subject=subject,
+            html_content=html,
+        ))
 
-    html_content = f"""
-        <html>
-            <body>
-                <h2>Password Reset Request</h2>
-                <p>We received a request to reset your password. Click the link below to continue:</p>
-                <a href="{reset_link}">Reset Password</a>
-                <p>This link will expire after a short period.</p>
-                <p>If you didn’t request a password reset, you can safely ignore this email.</p>
-            </body>
-        </html>
+
+class FakeProvider:
     """
-    try:
-        response = resend.Emails.send({
-            "from": sender,
-            "to": to_email,
-            "subject": subject,
-            "html": html_content
-        })
-        print("Email sent successfully: ", response)
-    except Exception as e:
-        print(f"Exception when sending email: {e}\n")
+    Local stand-in that keeps sent emails in memory (and logs them) instead of
+    calling a real service. ``fail_rate`` makes a share of sends fail, to
+    exercise retries and failover.
+    """
+    name = "fake"
+
+    def __init__(self, fail_rate: float = 0.0):
+        self.fail_rate = fail_rate
+        self.sent: List[Dict[str, str]] = []
+
+    async def send(self, to_email: str, subject: str, html: str):
+        if random.random() < self.fail_rate:
+            raise RuntimeError("Injected mail provider failure")
+        self.sent.append({"to": to_email, "subject": subject, "html": html})
+        logger.info("Fake email to %s: %s", to_email, subject)
+
+
+PROVIDERS = {
+    "resend": ResendProvider,
+    "brevo": BrevoProvider,
+    "fake": FakeProvider,
+}
+
+
+class EmailOutboxWorker:
+    """
+    Delivers queued emails in batches.
+
+    A short transaction claims due rows with ``FOR UPDATE SKIP LOCKED`` and
+    leases them by pushing ``next_attempt_at`` past the longest the sends can
+    take, so no row lock or pooled connection is held while providers are
+    called. The outcome is recorded in a second transaction, only if the
+    lease is still ours. Rows of a worker that died reappear once the lease
+    runs out.
+
+    Each email is tried on the providers in order under EMAIL_SEND_TIMEOUT,
+    skipping any whose circuit is open. Failed emails are retried with
+    exponential backoff and marked dead after EMAIL_MAX_ATTEMPTS attempts.
+    """
+
+    def __init__(self, providers: Optional[list] = None):
+        self.providers = providers or [PROVIDERS[name]() for name in settings.EMAIL_PROVIDERS]
+        self.breakers = {
+            provider.name: CircuitBreaker(
+                failure_threshold=settings.EMAIL_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.EMAIL_BREAKER_RESET_TIMEOUT,
+            )
+            for provider in self.providers
+        }
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+
+    async def _send(self, email: EmailOutbox) -> str:
+        """Send through the first provider that accepts it; returns its name."""
+        errors = []
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            try:
+                await asyncio.wait_for(
+                    provider.send(email.to_email, email.subject, email.html),
+                    timeout=settings.EMAIL_SEND_TIMEOUT,
+                )
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                errors.append(f"{provider.name}: {str(e) or type(e).__name__}")
+                continue
+            breaker.record_success()
+            return provider.name
+        raise RuntimeError("; ".join(errors) or "No email providers configured")
+
+    def lease(self) -> float:
+        """Seconds a claimed email stays with this worker."""
+        return settings.EMAIL_SEND_TIMEOUT * len(self.providers) + LEASE_MARGIN
+
+    async def _claim(self, batch_size: int) -> List[EmailOutbox]:
+        """Lease up to ``batch_size`` due emails and count the attempt."""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            batch = result.scalars().all()
+            for email in batch:
+                email.attempts += 1
+                email.next_attempt_at = now + timedelta(seconds=self.lease())
+            await session.commit()
+        return batch
+
+    async def _deliver(self, email: EmailOutbox) -> dict:
+        """Send a claimed email; returns the columns that record the outcome."""
+        try:
+            provider = await self._send(email)
+        except Exception as e:
+            if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                self.dead += 1
+                logger.error("Giving up on %s email %s to %s: %s", email.kind, email.id, email.to_email, e)
+                return {"status": "dead", "html": None, "last_error": str(e)[:1000]}
+            delay = min(MAX_RETRY_DELAY, settings.EMAIL_RETRY_BACKOFF * 2 ** (email.attempts - 1))
+            self.failed += 1
+            return {
+                "last_error": str(e)[:1000],
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay)),
+            }
+        self.sent += 1
+        return {"status": "sent", "html": None, "provider": provider, "sent_at": datetime.utcnow(), "last_error": None}
+
+    async def _record(self, outcomes: List[Tuple[EmailOutbox, dict]]):
+        """Store the outcomes of a batch, skipping rows whose lease another worker has taken over."""
+        async with async_session_maker() as session:
+            for email, values in outcomes:
+                await session.execute(
+                    update(EmailOutbox)
+                    .where(
+                        EmailOutbox.id == email.id,
+                        EmailOutbox.status == "pending",
+                        EmailOutbox.attempts == email.attempts,
+                    )
+                    .values(**values)
+                )
+            await session.commit()
+
+    async def deliver_pending(self, batch_size: Optional[int] = None) -> int:
+        """Send due emails until the backlog is empty; returns the emails attempted."""
+        batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+        attempted = 0
+        while True:
+            batch = await self._claim(batch_size)
+            outcomes = await asyncio.gather(*(self._deliver(email) for email in batch))
+            await self._record(list(zip(batch, outcomes)))
+
+            attempted += len(batch)
+            if len(batch) < batch_size:
+                return attempted
+
+    async def purge_finished(self, batch_size: Optional[int] = None) -> int:
+        """Delete sent and dead emails older than EMAIL_OUTBOX_RETENTION in batches; returns the rows deleted."""
+        batch_size = batch_size or settings.EMAIL_OUTBOX_PURGE_BATCH_SIZE
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION)
+        purged = 0
+        while True:
+            async with async_session_maker() as session:
+                finished = (
+                    select(EmailOutbox.id)
+                    .where(EmailOutbox.status.in_(("sent", "dead")), EmailOutbox.created_at <= cutoff)
+                    .limit(batch_size)
+                )
+                result = await session.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(finished)))
+                await session.commit()
+            purged += result.rowcount
+            if result.rowcount < batch_size:
+                break
+        if purged:
+            logger.info("Purged %s sent and dead emails", purged)
+        return purged
+
+    def stats(self) -> dict:
+        return {
+            "providers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+            "sent": self.sent,
+            "failed": self.failed,
+            "dead": self.dead,
+        }
+
+
+email_outbox = EmailOutboxWorker()
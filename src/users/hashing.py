@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from passlib.context import CryptContext
+
+from src.config import settings
+from src.errors import AuthBusy
+
+
+logger = logging.getLogger("govllminer.hashing")
+
+T = TypeVar("T")
+
+
+def _percentile(samples: deque, percentile: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * percentile))], 4)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated, size-bounded thread
+    pool so it never blocks the event loop. bcrypt releases the GIL, so the
+    workers use separate cores.
+
+    At most ``workers + queue_max`` operations are admitted at once; beyond
+    that calls fail fast with AuthBusy (503) instead of queueing behind a
+    login storm.
+    """
+
+    def __init__(self, context: CryptContext, workers: Optional[int] = None, queue_max: Optional[int] = None):
+        self.context = context
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS or min(4, os.cpu_count() or 1)
+        self.queue_max = settings.PASSWORD_HASH_QUEUE_MAX if queue_max is None else queue_max
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_waits: deque = deque(maxlen=500)
+        self.hash_times: deque = deque(maxlen=500)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self.in_flight >= self.workers + self.queue_max:
+            self.rejected += 1
+            raise AuthBusy()
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.queue_waits.append(started - submitted)
+                self.hash_times.append(time.perf_counter() - started)
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hash: str) -> bool:
+        return await self._run(self.context.verify, password, hash)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_max": self.queue_max,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_p50": _percentile(self.queue_waits, 0.5),
+            "queue_wait_p95": _percentile(self.queue_waits, 0.95),
+            "hash_time_p50": _percentile(self.hash_times, 0.5),
+            "hash_time_p95": _percentile(self.hash_times, 0.95),
+        }
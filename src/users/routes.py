@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from src.db.main import get_session
 from src.db.models import User
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.errors import UserAlreadyExists, InvalidCredentials, InvalidToken, ResetPasswordFailed
+from src.errors import UserAlreadyExists, InvalidCredentials, InvalidToken, ResetPasswordFailed, AuthBusy
 from .schemas import LoginResponseReadModel, ResetPasswordSchemaResponseModel, ForgotPasswordModel, ResetPasswordModel, GetTokenRequest, RegisterResponseReadModel, UserModel, DeleteResponseModel, UserCreateModel, UserLoginModel, TokenUser, VerificationMailSchemaResponse
-from .service import UserService
+from .service import UserService, invalidate_user
+from .tokens import RESET_PASSWORD
+from src.chat.routes import chat_client
 from typing import Annotated
-from .auth import create_access_token, get_current_user
+from .auth import create_access_token, get_current_user, revoke_token, revoke_user_tokens
 from fastapi.encoders import jsonable_encoder
 from fastapi import Response, Depends
 import uuid
@@ -34,11 +36,11 @@ async def register_user(
     """Register a new user."""
     user_service = UserService()
     try:
-        new_user = await user_service.create_user(user, session)
+        new_user, verification_token = await user_service.create_user(user, session)
         return RegisterResponseReadModel(
             status=True,
             message="User created successfully. Please check your mail to verify your account.",
-            verification_token=new_user.verification_token,
+            verification_token=verification_token,
             data=new_user
         )
     except UserAlreadyExists:
@@ -61,6 +63,8 @@ async def login(
         result = verify_email_response(user, access_token, response)
         return result
 
+    except AuthBusy:
+        raise
     except Exception as e:
         print("The error from the login function is", e)
         raise InvalidCredentials()
@@ -82,13 +86,13 @@ async def verify_email(
     user = await user_service.verify_token(token, session)
     print("The user from the verify email function is", user)
     
-    # Update user verification status
+    # Update user verification status; commits together with redeeming the token
     user.is_verified = True
-    user.verification_token = None
     
     # Commit changes to the database
     await session.commit()
     await session.refresh(user)
+    invalidate_user(user.email)
     
     # Generate access token for the verified user
     access_token = create_access_token(user=user)
@@ -170,9 +174,12 @@ async def resend_verification_token(
 async def delete_user(
     current_user: Annotated[TokenUser, Depends(get_current_user)],
     session: Annotated[AsyncSession, Depends(get_session)],
+    background_tasks: BackgroundTasks,
 ):
     user_service = UserService()
     await user_service.delete_user(current_user, session)
+    revoke_user_tokens(current_user.id)
+    background_tasks.add_task(chat_client.purge_deleted_sessions)
 
     return DeleteResponseModel(
         status=True,
@@ -186,8 +193,9 @@ async def logout(
     response: Response,
     current_user: Annotated[TokenUser, Depends(get_current_user)]
 ):
-    """Logout user by clearing the access token cookie."""
+    """Logout user by clearing the access token cookie and revoking the token."""
     response.delete_cookie(key="access_token")
+    revoke_token(current_user.access_token)
     return DeleteResponseModel(
         status=True,
         message="Logout successful"
@@ -219,20 +227,16 @@ async def reset_password_redirect(
     # Initialize UserService instance
     user_service = UserService()
 
-    user = await user_service.verify_token(token, session)
+    user = await user_service.verify_token(token, session, purpose=RESET_PASSWORD)
     
     if not user:
         raise InvalidToken()
     
     # Update user verification status
     user.is_verified = True
-    user.verification_token = None
-    
-    # Commit changes to the database
-    await session.commit()
-    await session.refresh(user)
     
-    #  Reset the password
+    #  Reset the password; redeeming the token commits with it, so a failed
+    #  reset leaves the link usable
     response = await user_service.reset_password(user, payload, session)
             
     return response
@@ -259,7 +263,7 @@ async def validate(user_data: dict, request: Request, response: Optional[Respons
                 email=user_data["email"],
                 password="password1234"
             )
-            user = await user_service.create_user(user_model, session, is_google=True) 
+            user, _ = await user_service.create_user(user_model, session, is_google=True) 
         
         access_token_expires = timedelta(minutes=300)
         print("The user going into the access token is ", user)
@@ -1,20 +1,66 @@
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Any, Optional
+from typing import Any, Optional, Tuple
 from sqlmodel import select, Session
-from src.db.models import User
-from src.errors import UserAlreadyExists, InvalidCredentials, EmailAlreadyVerified, ResetPasswordFailed, AccountNotVerified
+from sqlalchemy import delete
+from src.db.models import User, ChatSession
+from src.chat.service import ChatAPIClient
+from src.errors import UserAlreadyExists, InvalidCredentials, EmailAlreadyVerified, ResetPasswordFailed, AccountNotVerified, AuthBusy
 from .schemas import UserCreateModel, VerificationMailSchemaResponse, ResetPasswordSchemaResponseModel, ResetPasswordModel, ForgotPasswordModel
-from .auth import generate_passwd_hash, verify_password
-from .email import send_verification_email, send_reset_password_email, send_verification_email_resend, send_reset_password_email_resend
+from .auth import password_hasher
+from .email import queue_verification_email, queue_reset_password_email
+from .tokens import issue_token, consume_token, VERIFY_EMAIL, RESET_PASSWORD
+from src.cache import TTLCache
+from src.config import settings
 import uuid
 
+
+# Columns of a user kept in the cache: what sign-in and the auth emails need
+USER_CACHE_FIELDS = ("id", "email", "password", "full_name", "is_verified", "created_at", "updated_at")
+_UNKNOWN = object()
+
+# Normalized email -> cached user fields, or _UNKNOWN for emails with no account
+user_cache = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def normalize_email(email: str) -> str:
+    """Trim and lowercase the domain, the same normalization EmailStr applies."""
+    local, _, domain = email.strip().rpartition("@")
+    return f"{local}@{domain.lower()}" if local else email.strip()
+
+
+def cache_user(user: User):
+    user_cache.set(normalize_email(user.email), {field: getattr(user, field) for field in USER_CACHE_FIELDS})
+
+
+def invalidate_user(email: str):
+    """Drop a cached user; call after committing any change to them."""
+    user_cache.pop(normalize_email(email))
+
+
 class UserService:
-    async def get_user_by_email(self, email: str, session: AsyncSession) -> Optional[User]:
-        """Retrieve a user by their email address."""
+    async def get_user_by_email(self, email: str, session: AsyncSession, use_cache: bool = True) -> Optional[User]:
+        """
+        Retrieve a user by their email address. Served from the user cache when
+        possible, in which case the User is transient (not attached to
+        ``session``) and must not be modified.
+        """
+        email = normalize_email(email)
+        if use_cache:
+            cached = user_cache.get(email)
+            if cached is _UNKNOWN:
+                return None
+            if cached is not None:
+                return User(**cached)
+
         statement = select(User).where(User.email == email)
         user = await session.execute(statement)
         user = user.scalar_one_or_none()
+        if user is None:
+            # Short-lived, so a new sign-up elsewhere is seen soon
+            user_cache.set(email, _UNKNOWN, ttl=settings.USER_CACHE_NEGATIVE_TTL)
+        else:
+            cache_user(user)
         return user
 
     async def user_exists(self, email: str, session: AsyncSession) -> bool:
@@ -22,16 +68,16 @@ class UserService:
         user = await self.get_user_by_email(email, session)
         return user is not None
 
-    async def create_user(self, user_data: UserCreateModel, session: AsyncSession, is_google: Optional[bool] = False):
-        """Create a new user in the database."""
+    async def create_user(self, user_data: UserCreateModel, session: AsyncSession, is_google: Optional[bool] = False) -> Tuple[User, Optional[str]]:
+        """Create a new user in the database; returns it with its email verification token (None for Google sign-ups)."""
         if await self.user_exists(user_data.email, session):
             raise UserAlreadyExists()
         
         print("The data coming in: ", user_data)
         
         try:
-            verification_token = str(uuid.uuid4())
-            hash_password = generate_passwd_hash(user_data.password)
+            verification_token = None
+            hash_password = await password_hasher.hash(user_data.password)
 
             print("The user full name is: ", user_data.full_name)
 
@@ -40,25 +86,28 @@ class UserService:
                 email=user_data.email,
                 password=hash_password,
                 is_verified=True if is_google else False,
-                verification_token=verification_token if not is_google else None
             )
 
             session.add(new_user)
-            await session.commit()
-
             if not is_google:
-                # send_verification_email(new_user.email, verification_token)
-                send_verification_email_resend(new_user.email, verification_token)
+                await session.flush()
+                verification_token = await issue_token(session, new_user.id, VERIFY_EMAIL)
+                queue_verification_email(session, new_user.email, verification_token)
+            await session.commit()
+            cache_user(new_user)
 
-            return new_user
+            return new_user, verification_token
         except Exception as e:
             await session.rollback()
             raise e
         
-    async def verify_token(self, token: str, session: AsyncSession) -> User:
-        """Verify the token and retrieve the associated user."""
-        result = await session.execute(select(User).where(User.verification_token == token))
-        user = result.scalars().first()
+    async def verify_token(self, token: str, session: AsyncSession, purpose: str = VERIFY_EMAIL) -> User:
+        """
+        Redeem a single-use token and retrieve the associated user. The token is
+        gone once the caller commits; a rollback makes it usable again.
+        """
+        user_id = await consume_token(session, token, purpose)
+        user = await session.get(User, user_id) if user_id else None
         print("The user from the token is: ", user)
         if not user:
             raise InvalidCredentials()
@@ -68,34 +117,51 @@ class UserService:
         """Authenticate a user by email and password."""
         user = await self.get_user_by_email(email, session)
         print("The user from the authenticate function is: ", user)
-        if not user or not verify_password(password, user.password):
+        if not user:
             raise InvalidCredentials()
+        if not await password_hasher.verify(password, user.password):
+            # The password may have been changed by another worker since it was cached
+            fresh = await self.get_user_by_email(email, session, use_cache=False)
+            if not fresh or fresh.password == user.password or not await password_hasher.verify(password, fresh.password):
+                raise InvalidCredentials()
+            user = fresh
         if not user.is_verified:
-            raise AccountNotVerified()
-        await session.refresh(user)
+            # Same for a verification that happened elsewhere
+            user = await self.get_user_by_email(email, session, use_cache=False)
+            if not user or not user.is_verified:
+                raise AccountNotVerified()
         return user
 
     async def update_user(self, user: User, user_data: dict, session: AsyncSession) -> User:
         """Update a user's information in the database."""
+        previous_email = user.email
         for k, v in user_data.items():
             setattr(user, k, v)
         session.add(user)
         await session.commit()
         await session.refresh(user)
+        invalidate_user(previous_email)
+        invalidate_user(user.email)
         return user
     
         
     async def delete_user(self, user: User, session: AsyncSession) -> None:
-        """Delete a user from the database."""
-        statement = select(User).where(User.id == user.id)
-        result = await session.execute(statement)
-        db_user = result.scalar_one_or_none()
+        """
+        Delete a user from the database. Their chat sessions are detached and
+        marked deleted in the same transaction and purged in the background.
+        """
+        session_ids = await ChatAPIClient.mark_sessions_deleted(
+            session, ChatSession.user_id == user.id, detach_user=True
+        )
+        result = await session.execute(delete(User).where(User.id == user.id))
 
-        if db_user:
-            await session.delete(db_user)
+        if result.rowcount:
             await session.commit()
+            invalidate_user(user.email)
+            ChatAPIClient.forget_sessions(session_ids)
             return None
         else:
+            await session.rollback()
             raise InvalidCredentials()
         
     # resend verification email
@@ -106,12 +172,9 @@ class UserService:
             if user:
                 if user.is_verified:
                     raise EmailAlreadyVerified()
-                verification_token = str(uuid.uuid4())
-                user.verification_token = verification_token
-                session.add(user)
+                verification_token = await issue_token(session, user.id, VERIFY_EMAIL)
+                queue_verification_email(session, user.email, verification_token)
                 await session.commit()
-                # send_verification_email(user.email, verification_token)
-                send_verification_email_resend(user.email, verification_token)
             else:
                 raise InvalidCredentials()
             return VerificationMailSchemaResponse(
@@ -129,15 +192,18 @@ class UserService:
         """Reset the user's password"""
         try:
             # Update the user's password
-            user.password = generate_passwd_hash(payload.password)
+            user.password = await password_hasher.hash(payload.password)
             session.add(user)
             await session.commit()
             await session.refresh(user)
+            invalidate_user(user.email)
             
             return ResetPasswordSchemaResponseModel(
                 status=True,
                 message="Password reset successfully."
             )
+        except AuthBusy:
+            raise
         except Exception as e:
             await session.rollback()
             raise ResetPasswordFailed()
@@ -150,16 +216,12 @@ class UserService:
         if not user:
             raise InvalidCredentials()
 
-        # Generate and assign a new reset token
-        reset_token = str(uuid.uuid4())
-        user.verification_token = reset_token
+        # Generate a new reset token, replacing any earlier one
+        reset_token = await issue_token(session, user.id, RESET_PASSWORD)
 
-        session.add(user)
+        # Sent by the outbox worker once this commits
+        queue_reset_password_email(session, user.email, reset_token)
         await session.commit()
-        await session.refresh(user)
-
-        # Send the reset password email
-        send_reset_password_email_resend(user.email, reset_token)
 
         return ResetPasswordSchemaResponseModel(
             status=True,
@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.db.main import async_session_maker
+from src.db.models import AuthToken
+
+
+logger = logging.getLogger("govllminer.tokens")
+
+VERIFY_EMAIL = "verify_email"
+RESET_PASSWORD = "reset_password"
+
+
+def _ttl(purpose: str) -> float:
+    return {
+        VERIFY_EMAIL: settings.AUTH_TOKEN_VERIFY_EMAIL_TTL,
+        RESET_PASSWORD: settings.AUTH_TOKEN_RESET_PASSWORD_TTL,
+    }[purpose]
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_token(session: AsyncSession, user_id: uuid.UUID, purpose: str) -> str:
+    """
+    Create a single-use token for ``purpose`` and return it. Only its hash is
+    stored, and earlier tokens of the same purpose for the user stop working.
+    Nothing is committed; the caller commits with the change that needs it.
+    """
+    await session.execute(
+        delete(AuthToken).where(AuthToken.user_id == user_id, AuthToken.purpose == purpose)
+    )
+    token = secrets.token_urlsafe(32)
+    session.add(AuthToken(
+        token_hash=hash_token(token),
+        purpose=purpose,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(seconds=_ttl(purpose)),
+    ))
+    return token
+
+
+async def consume_token(session: AsyncSession, token: str, purpose: str) -> Optional[uuid.UUID]:
+    """Redeem a token: one primary-key probe that deletes it. Returns the user id, or None if invalid or expired."""
+    result = await session.execute(
+        delete(AuthToken)
+        .where(
+            AuthToken.token_hash == hash_token(token),
+            AuthToken.purpose == purpose,
+            AuthToken.expires_at > datetime.utcnow(),
+        )
+        .returning(AuthToken.user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def purge_expired_tokens(batch_size: Optional[int] = None) -> int:
+    """Delete expired tokens in batches, each in its own transaction; returns the rows deleted."""
+    batch_size = batch_size or settings.AUTH_TOKEN_PURGE_BATCH_SIZE
+    purged = 0
+    while True:
+        async with async_session_maker() as session:
+            expired = (
+                select(AuthToken.token_hash)
+                .where(AuthToken.expires_at <= datetime.utcnow())
+                .limit(batch_size)
+            )
+            result = await session.execute(delete(AuthToken).where(AuthToken.token_hash.in_(expired)))
+            await session.commit()
+        purged += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    if purged:
+        logger.info("Purged %s expired auth tokens", purged)
+    return purged
@@ -0,0 +1,36 @@
+import os
+
+
+# Settings that have no default; the values only need to exist for the tests
+for name, value in {
+    "BREVO_API_KEY": "test",
+    "FRONTEND_URL": "http://localhost:3000",
+    "BACKEND_URL": "http://localhost:8000",
+    "EMAIL_FROM": "no-reply@example.com",
+    "JWT_SECRET": "test",
+    "JWT_ALGORITHM": "HS256",
+    "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test",
+    "GOOGLE_REDIRECT_URI": "http://localhost:8000/auth/google/callback",
+    "SESSION_SECRET_KEY": "test",
+    "RESEND_API_KEY": "test",
+    "DATABASE_URL": "postgresql+asyncpg://postgres@localhost:5432/govllminer_test",
+}.items():
+    os.environ.setdefault(name, value)
+
+# Tests that need PostgreSQL run against TEST_DATABASE_URL only, never against
+# whatever DATABASE_URL points at; they are skipped when it is not set
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+import pytest
+
+
+requires_db = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
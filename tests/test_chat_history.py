@@ -0,0 +1,16 @@
+import asyncio
+import uuid
+
+import pytest
+
+from src.chat.service import ChatAPIClient
+from src.errors import InvalidCursor
+
+
+def test_before_and_after_together_are_rejected():
+    client = ChatAPIClient()
+    cursor = "cursor"
+
+    # Rejected up front, before the session is looked up
+    with pytest.raises(InvalidCursor):
+        asyncio.run(client.get_chat_by_session_id(str(uuid.uuid4()), None, before=cursor, after=cursor))
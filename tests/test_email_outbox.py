@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from src.config import settings
+from src.db.main import async_session_maker, engine
+from src.db.models import EmailOutbox
+from src.users.email import EmailOutboxWorker, FakeProvider, queue_email
+
+from .conftest import requires_db
+
+
+pytestmark = [pytest.mark.anyio, requires_db]
+
+
+class SlowProvider(FakeProvider):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    async def send(self, to_email: str, subject: str, html: str):
+        await asyncio.sleep(self.delay)
+        await super().send(to_email, subject, html)
+
+
+@pytest.fixture
+async def outbox():
+    async with engine.begin() as conn:
+        await conn.run_sync(EmailOutbox.__table__.create, checkfirst=True)
+        await conn.execute(delete(EmailOutbox))
+    yield
+    async with engine.begin() as conn:
+        await conn.execute(delete(EmailOutbox))
+    await engine.dispose()
+
+
+async def enqueue(count: int = 1):
+    async with async_session_maker() as session:
+        for i in range(count):
+            queue_email(session, "verification", f"user{i}@example.com", f"Subject {i}", "<p>hi</p>")
+        await session.commit()
+
+
+async def rows():
+    async with async_session_maker() as session:
+        return (await session.execute(select(EmailOutbox).order_by(EmailOutbox.subject))).scalars().all()
+
+
+async def make_due():
+    async with async_session_maker() as session:
+        await session.execute(update(EmailOutbox).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        await session.commit()
+
+
+async def test_queued_email_is_delivered(outbox):
+    provider = FakeProvider()
+    await enqueue()
+
+    assert await EmailOutboxWorker([provider]).deliver_pending() == 1
+
+    assert [sent["subject"] for sent in provider.sent] == ["Subject 0"]
+    [email] = await rows()
+    assert (email.status, email.provider, email.attempts) == ("sent", "fake", 1)
+    assert email.sent_at is not None
+    assert email.html is None
+
+
+async def test_email_is_not_queued_without_commit(outbox):
+    async with async_session_maker() as session:
+        queue_email(session, "verification", "user@example.com", "Subject", "<p>hi</p>")
+        await session.rollback()
+
+    assert await EmailOutboxWorker([FakeProvider()]).deliver_pending() == 0
+
+
+async def test_failures_back_off_then_go_dead(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_MAX_ATTEMPTS", 3)
+    worker = EmailOutboxWorker([FakeProvider(fail_rate=1.0)])
+    await enqueue()
+
+    for attempt in (1, 2):
+        before = datetime.utcnow()
+        await worker.deliver_pending()
+        [email] = await rows()
+        delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (attempt - 1)
+        assert (email.status, email.attempts) == ("pending", attempt)
+        assert "Injected" in email.last_error
+        assert before + timedelta(seconds=delay / 2 - 1) <= email.next_attempt_at
+        assert email.next_attempt_at <= datetime.utcnow() + timedelta(seconds=delay)
+
+        # Not due yet: nothing is attempted until the backoff has passed
+        assert await worker.deliver_pending() == 0
+        await make_due()
+
+    await worker.deliver_pending()
+    [email] = await rows()
+    assert (email.status, email.attempts) == ("dead", 3)
+    assert email.html is None
+    assert await worker.deliver_pending() == 0
+
+
+async def test_hung_provider_times_out_and_is_retried(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_SEND_TIMEOUT", 0.05)
+    await enqueue()
+
+    await asyncio.wait_for(EmailOutboxWorker([SlowProvider(delay=30)]).deliver_pending(), timeout=5)
+
+    [email] = await rows()
+    assert (email.status, email.attempts) == ("pending", 1)
+    assert "TimeoutError" in email.last_error
+
+
+async def test_concurrent_workers_never_send_an_email_twice(outbox):
+    providers = [SlowProvider(delay=0.01), SlowProvider(delay=0.01)]
+    workers = [EmailOutboxWorker([provider]) for provider in providers]
+    await enqueue(40)
+
+    await asyncio.gather(*(worker.deliver_pending(batch_size=5) for worker in workers))
+
+    subjects = [sent["subject"] for provider in providers for sent in provider.sent]
+    assert len(subjects) == len(set(subjects)) == 40
+    assert all(provider.sent for provider in providers)
+    assert {email.status for email in await rows()} == {"sent"}
+
+
+async def test_outcome_of_an_expired_lease_is_ignored(outbox):
+    stale = EmailOutboxWorker([FakeProvider()])
+    await enqueue()
+    [claimed] = await stale._claim(batch_size=1)
+
+    # The lease runs out before the first worker reports back
+    await make_due()
+    provider = FakeProvider()
+    assert await EmailOutboxWorker([provider]).deliver_pending() == 1
+    await stale._record([(claimed, {"last_error": "late", "next_attempt_at": datetime.utcnow()})])
+
+    [email] = await rows()
+    assert (email.status, email.attempts, email.last_error) == ("sent", 2, None)
+    assert len(provider.sent) == 1
+
+
+async def test_purge_removes_only_old_finished_emails(outbox, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_OUTBOX_RETENTION", 3600)
+    await enqueue(4)
+    old = datetime.utcnow() - timedelta(hours=2)
+    async with async_session_maker() as session:
+        for subject, status, created_at in (
+            ("Subject 0", "sent", old),
+            ("Subject 1", "dead", old),
+            ("Subject 2", "pending", old),
+            ("Subject 3", "sent", datetime.utcnow()),
+        ):
+            await session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.subject == subject)
+                .values(status=status, created_at=created_at)
+            )
+        await session.commit()
+
+    assert await EmailOutboxWorker([FakeProvider()]).purge_finished(batch_size=1) == 2
+
+    assert [email.subject for email in await rows()] == ["Subject 2", "Subject 3"]
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.chat.resilience import AdaptiveLimiter, CircuitBreaker, EndpointGuard
+from src.config import settings
+from src.errors import UpstreamUnavailable
+
+
+def make_guard() -> EndpointGuard:
+    guard = EndpointGuard("test", latency_target=1.0)
+    guard.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    return guard
+
+
+async def ok():
+    return httpx.Response(200)
+
+
+async def fail():
+    return httpx.Response(500)
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_rejected_by_limiter_does_not_wedge_breaker():
+    async def scenario():
+        guard = make_guard()
+        await guard.call(fail)
+        assert guard.breaker.state == CircuitBreaker.OPEN
+
+        # The probe slot is claimed, then the limiter turns the call away
+        guard.limiter.limit = 0
+        with pytest.raises(UpstreamUnavailable, match="concurrency limit"):
+            await guard.call(ok)
+
+        guard.limiter.limit = 1
+        response = await guard.call(ok)
+        assert response.status_code == 200
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_call_is_not_counted_as_a_failure():
+    async def scenario():
+        guard = make_guard()
+        limit = guard.limiter.limit
+
+        async def hang():
+            await asyncio.sleep(30)
+
+        call = asyncio.ensure_future(guard.call(hang))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+        assert guard.breaker.failures == 0
+        assert (guard.limiter.limit, guard.limiter.in_flight) == (limit, 0)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_gives_the_probe_slot_back():
+    async def scenario():
+        guard = make_guard()
+        await guard.call(fail)
+
+        async def hang():
+            await asyncio.sleep(30)
+
+        probe = asyncio.ensure_future(guard.call(hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert (await guard.call(ok)).status_code == 200
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_transport_errors_count_as_failures():
+    async def scenario():
+        guard = make_guard()
+
+        async def unreachable():
+            raise httpx.ConnectError("refused")
+
+        with pytest.raises(httpx.ConnectError):
+            await guard.call(unreachable)
+        assert guard.breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_burst_of_slow_releases_shrinks_the_limit_once():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=40, latency_target=0.5)
+    for _ in range(20):
+        assert limiter.try_acquire()
+    for _ in range(20):
+        limiter.release(latency=2.0, ok=False)
+
+    assert limiter.limit == pytest.approx(40 * 0.7)
+    assert limiter.in_flight == 0
+
+
+def test_congestion_after_the_last_decrease_shrinks_the_limit_again():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=40, latency_target=0.5)
+    limiter.try_acquire()
+    limiter.release(latency=2.0, ok=False)
+
+    # Started after the first decrease, so it is new evidence
+    limiter.try_acquire()
+    time.sleep(0.05)
+    limiter.release(latency=0.01, ok=False)
+
+    assert limiter.limit == pytest.approx(40 * 0.7 * 0.7)
+
+
+def test_cancelled_caller_cancels_the_hedged_request(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_HEDGING", True)
+    monkeypatch.setattr(settings, "UPSTREAM_RETRY_ATTEMPTS", 0)
+
+    async def scenario():
+        guard = make_guard()
+        guard.hedger.latencies.extend([1.0] * guard.hedger.min_samples)
+        started = asyncio.Event()
+        finished = []
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(30)
+            finally:
+                finished.append(True)
+            return httpx.Response(200)
+
+        # Cancelled while waiting for the hedge delay, before any backup is sent
+        call = asyncio.ensure_future(guard.call(slow, idempotent=True))
+        await started.wait()
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+
+        assert finished == [True]
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi import FastAPI, File, UploadFile
+
+from src.config import settings
+from src.middleware import UploadSizeLimitMiddleware
+
+
+app = FastAPI()
+
+
+@app.post("/chat/file/upload")
+async def upload(file: UploadFile = File(...)):
+    return {"size": file.size}
+
+
+def post(content_type: str, size: int, monkeypatch, chunk_size: int = 100):
+    """Stream a single-file multipart body with no Content-Length, ``chunk_size`` bytes at a time."""
+    monkeypatch.setattr(settings, "UPLOAD_SIZE_LIMITS", {"application/pdf": 1000, "image/png": 5000})
+    middleware = UploadSizeLimitMiddleware(app, max_bytes=100_000)
+    body = (
+        b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"f\"\r\n"
+        + f"Content-Type: {content_type}\r\n\r\n".encode()
+        + b"x" * size
+        + b"\r\n--b--\r\n"
+    )
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    read = 0
+    sent = []
+
+    async def receive():
+        nonlocal read
+        read += 1
+        return {"type": "http.request", "body": chunks[read - 1], "more_body": read < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/chat/file/upload", "root_path": "",
+        "query_string": b"", "http_version": "1.1", "scheme": "http", "server": ("test", 80),
+        "headers": [(b"content-type", b"multipart/form-data; boundary=b")],
+    }
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], read, len(chunks)
+
+
+def test_file_under_its_type_ceiling_is_accepted(monkeypatch):
+    status, read, total = post("application/pdf", 900, monkeypatch)
+    assert status == 200
+    assert read == total
+
+
+def test_file_over_its_type_ceiling_is_cut_off_while_streaming(monkeypatch):
+    status, read, total = post("application/pdf", 20_000, monkeypatch)
+    assert status == 413
+    # Stopped right after the PDF ceiling, far below the overall cap
+    assert read <= 1000 // 100 + 3 < total
+
+
+def test_ceiling_follows_the_part_content_type(monkeypatch):
+    assert post("image/png", 4000, monkeypatch)[0] == 200
+    assert post("image/png", 6000, monkeypatch)[0] == 413